@@ -40,8 +40,14 @@ setup(
     classifiers=[
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License'
     ],
@@ -53,6 +59,10 @@ setup(
     # simple. Or you can use find_packages().
     packages=find_packages(),
 
+    # asyncio support (weathergc.aio, weathergc.server) and the lazy module
+    # attributes (PEP 562) need Python 3.7
+    python_requires='>=3.7',
+
     # Alternatively, if you want to distribute just a my_module.py, uncomment
     # this:
     # py_modules=[],
@@ -74,6 +84,7 @@ setup(
     # installed, specify them here.  If using Python 2.6 or less, then these
     # have to be included in MANIFEST.in as well.
     package_data={
+        'weathergc': ['cities.tsv'],
     },
 
     # Although 'package_data' is the preferred approach, in some case you may
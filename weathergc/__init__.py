@@ -1 +1,14 @@
 from weathergc.forecast import Forecast
+
+# imported on first use, see __getattr__
+_LAZY = {'ForecastBatch': 'weathergc.batch', 'fetch_many': 'weathergc.batch'}
+
+
+def __getattr__(name):
+    '''Import batch support on first use (PEP 562).'''
+    if name not in _LAZY:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    module = __import__(_LAZY[name], fromlist=[name])
+    value = globals()[name] = getattr(module, name)
+    return value
@@ -0,0 +1,228 @@
+'''asyncio client for weather.gc.ca feeds.
+
+Downloads are done with non-blocking streams on the running event loop,
+while parsing and validation run in an executor so that a large feed never
+stalls the loop.
+'''
+import asyncio
+import functools
+import ssl
+
+from weathergc import metrics
+from weathergc.batch import BatchResult
+from weathergc.connection import (FEED_PATH, HOST, FetchError, Response,
+                                  decompressor)
+from weathergc.forecast import Forecast
+
+DEFAULT_CONCURRENCY = 16
+
+
+async def _read_response(reader):
+    '''Read an HTTP/1.1 response from reader.
+
+    Returns:
+        tuple of (status, reason, headers, body); header names are lowercase
+    '''
+    status_line = (await reader.readline()).decode('latin-1')
+    _, status, reason = (status_line.rstrip('\r\n').split(' ', 2) + [''])[:3]
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b''.join(chunks)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()
+
+    return int(status), reason, headers, body
+
+
+async def fetch_feed_conditional_async(city_code, etag=None,
+                                       last_modified=None, host=HOST,
+                                       timeout=30):
+    '''Download the atom feed for a city unless it is unchanged, without
+    blocking the loop.
+
+    Args:
+        city_code: code for the location, e.g. on-82
+        etag: ETag header of the previously retrieved feed
+        last_modified: Last-Modified header of the previously retrieved feed
+        host: host name to request the feed from
+        timeout: seconds allowed for connecting, and again for sending the
+                 request and reading the response
+
+    Returns:
+        Response; status is 304 and body empty when the feed is unchanged
+    '''
+    path = FEED_PATH % city_code
+    conditions = ''
+    if etag:
+        conditions += 'If-None-Match: %s\r\n' % etag
+    if last_modified:
+        conditions += 'If-Modified-Since: %s\r\n' % last_modified
+
+    with metrics.timed('fetch'):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, 443,
+                                    ssl=ssl.create_default_context()),
+            timeout)
+        try:
+            writer.write(('GET %s HTTP/1.1\r\n'
+                          'Host: %s\r\n'
+                          'Accept-Encoding: gzip\r\n'
+                          '%s'
+                          'Connection: close\r\n\r\n'
+                          % (path, host, conditions)).encode())
+            status, reason, headers, body = await asyncio.wait_for(
+                _read_response(reader), timeout)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ssl.SSLError, ConnectionError):
+                # servers often drop the connection without a TLS
+                # close_notify once the response has been sent
+                pass
+    if metrics.recorder is not None:
+        metrics.recorder.downloaded(status, len(body))
+
+    if status == 304:
+        return Response(status, reason, headers, b'')
+    if status != 200:
+        raise FetchError(status, reason, path)
+    decoder = decompressor(headers.get('content-encoding', '').lower())
+    if decoder is not None:
+        body = decoder.decompress(body) + decoder.flush()
+    return Response(status, reason, headers, body)
+
+
+async def fetch_feed_async(city_code, host=HOST, timeout=30):
+    '''Download the raw atom feed for a city without blocking the loop.
+
+    Args:
+        city_code: code for the location, e.g. on-82
+        host: host name to request the feed from
+        timeout: seconds allowed for connecting, and again for sending the
+                 request and reading the response
+
+    Returns:
+        bytes of the atom xml
+    '''
+    response = await fetch_feed_conditional_async(city_code, host=host,
+                                                  timeout=timeout)
+    return response.body
+
+
+class AsyncForecast(Forecast):
+    '''Forecast whose network I/O runs on an asyncio event loop.
+
+    Create instances with ``await AsyncForecast.create(city_code)``; calling
+    the constructor directly behaves like Forecast and blocks.
+    '''
+
+    @classmethod
+    async def create(cls, city_code, executor=None):
+        '''Fetch and parse the forecast for city_code.
+
+        Parsing, validation and collation run in the executor, so as_dict()
+        and as_json() then cost no more than a copy and an encoding.
+
+        Args:
+            city_code: code for the location
+            executor: concurrent.futures executor used for parsing; the
+                      loop's default executor when None
+
+        Returns:
+            AsyncForecast
+        '''
+        if not cls._valid_city_code(city_code):
+            raise ValueError('%s is not a valid city code.' % city_code)
+
+        response = await fetch_feed_conditional_async(city_code.lower())
+        loop = asyncio.get_running_loop()
+        forecast = await loop.run_in_executor(
+            executor, functools.partial(cls._collated_from_xml, city_code,
+                                        response.body))
+        forecast._etag = response.headers.get('etag')
+        forecast._last_modified = response.headers.get('last-modified')
+        return forecast
+
+    async def refresh_async(self, executor=None):
+        '''Non-blocking equivalent of refresh().
+
+        Like refresh(), the request is conditional on the validators of
+        the feed last loaded.
+
+        Returns:
+            True if new data was loaded, False if the feed was unchanged.
+        '''
+        response = await fetch_feed_conditional_async(
+            self._city_code, self._etag, self._last_modified)
+        if response.status == 304:
+            return False
+        loop = asyncio.get_running_loop()
+        changed = await loop.run_in_executor(
+            executor, self._load_and_collate, response.body)
+        self._etag = response.headers.get('etag')
+        self._last_modified = response.headers.get('last-modified')
+        return changed
+
+    @classmethod
+    def _collated_from_xml(cls, city_code, xml):
+        '''from_xml, with the sections validated and collated.'''
+        forecast = cls.from_xml(city_code, xml)
+        forecast._collated()
+        return forecast
+
+    def _load_and_collate(self, xml):
+        '''_load_if_changed, with the sections validated and collated.'''
+        changed = self._load_if_changed(xml)
+        self._collated()
+        return changed
+
+
+async def gather_forecasts(city_codes, concurrency=DEFAULT_CONCURRENCY,
+                           executor=None):
+    '''Fetch many cities with at most `concurrency` requests in flight.
+
+    Args:
+        city_codes: iterable of city codes
+        concurrency: maximum number of simultaneous downloads
+        executor: executor used for parsing
+
+    Returns:
+        BatchResult with per city forecasts and errors
+    '''
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(city_code):
+        async with semaphore:
+            return await AsyncForecast.create(city_code, executor)
+
+    city_codes = list(city_codes)
+    outcomes = await asyncio.gather(
+        *[fetch_one(city_code) for city_code in city_codes],
+        return_exceptions=True)
+
+    result = BatchResult()
+    for city_code, outcome in zip(city_codes, outcomes):
+        if isinstance(outcome, Exception):
+            result.errors[city_code] = outcome
+        else:
+            result.forecasts[city_code] = outcome
+    return result
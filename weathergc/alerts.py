@@ -0,0 +1,202 @@
+'''Index of the warnings, watches and statements in effect across cities.
+
+Each city's Warnings and Watches entries are indexed when its feed is
+loaded, replacing what was held for that city, and are then found by
+city, by kind (e.g. 'SEVERE THUNDERSTORM WATCH') or by province without a
+sweep over every city:
+
+    index = AlertIndex()
+    f = Forecast('on-82', on_change=index.on_change)
+    Poller(codes, on_refresh=lambda f, changed, error: index.update(f))
+    index.cities('RAINFALL WARNING')     # ['ns-19', ...]
+    index.in_province('ON')              # [Alert(city_code='on-82', ...)]
+
+Feeds carry no expiry time, so an alert is dropped max_age seconds after
+its updated (or published) time unless a newer feed of its city re-issues
+it.  Environment Canada re-issues warnings in effect every few hours, and
+the expiry only clears alerts of cities that stopped being refreshed.
+'''
+from __future__ import absolute_import
+import calendar
+import heapq
+import itertools
+import re
+import threading
+import time
+from collections import namedtuple
+
+NO_WARNINGS = 'No watches or warnings in effect'
+SECTION = 'Warnings and Watches'
+
+# seconds after its updated time an alert is kept without being re-issued
+DEFAULT_MAX_AGE = 24 * 3600
+
+_KIND = re.compile(r'^(.*?)\s+(?:IN EFFECT|ENDED)\b')
+
+Alert = namedtuple('Alert', ['city_code', 'kind', 'title', 'summary',
+                             'published', 'updated', 'expires'])
+
+
+def timestamp(updated):
+    '''Seconds since the epoch of an atom timestamp, or None.'''
+    try:
+        return calendar.timegm(time.strptime(updated, '%Y-%m-%dT%H:%M:%SZ'))
+    except (TypeError, ValueError):
+        return None
+
+
+def in_effect(entry):
+    '''True for a Warnings and Watches entry that is a warning, watch or
+    statement that has not ended.'''
+    title = entry.get('title') or ''
+    return bool(title) and not title.startswith(NO_WARNINGS) and \
+        'ENDED' not in title
+
+
+def kind(title):
+    '''Kind of alert from its title, e.g. 'RAINFALL WARNING' for
+    'RAINFALL WARNING IN EFFECT, Halifax'.'''
+    match = _KIND.match(title)
+    return match.group(1) if match else title.split(',')[0].strip()
+
+
+class AlertIndex(object):
+    '''Thread-safe index of the alerts in effect.
+
+    Lookups cost in proportion to what they return; expired alerts are
+    dropped from a heap ordered by expiry time as queries are made.
+    '''
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._by_city = {}
+        # kind -> {city code: alerts of that kind}
+        self._by_kind = {}
+        # province -> set of city codes with alerts
+        self._by_province = {}
+        # (expires, sequence, city code, alert), possibly of replaced alerts
+        self._expiry = []
+        self._sequence = itertools.count()
+
+    def update(self, forecast, now=None):
+        '''Replace the alerts of a city with those of its Forecast.'''
+        self.set_alerts(forecast.city_code, forecast.warnings, now)
+
+    def on_change(self, forecast, changes):
+        '''Forecast on_change callback, re-indexing a city only when its
+        Warnings and Watches changed.'''
+        if any(change.section == SECTION for change in changes):
+            self.update(forecast)
+
+    def set_alerts(self, city_code, entries, now=None):
+        '''Replace the alerts of a city.
+
+        Args:
+            city_code: code for the location, e.g. on-82
+            entries: Warnings and Watches entries, as in Forecast.warnings
+            now: current time in seconds since the epoch
+        '''
+        city_code = city_code.lower()
+        now = time.time() if now is None else now
+        alerts = []
+        for entry in entries:
+            if not in_effect(entry):
+                continue
+            issued = timestamp(entry.get('updated')) or \
+                timestamp(entry.get('published')) or now
+            alerts.append(Alert(city_code, kind(entry['title']),
+                                entry['title'], entry.get('summary'),
+                                entry.get('published'), entry.get('updated'),
+                                issued + self.max_age))
+
+        alerts = tuple(alert for alert in alerts if alert.expires > now)
+        with self._lock:
+            if alerts != self._by_city.get(city_code, ()):
+                self._remove(city_code)
+                if alerts:
+                    self._add(city_code, alerts)
+            self._expire(now)
+
+    def for_city(self, city_code, now=None):
+        '''Return the alerts of a city.'''
+        with self._lock:
+            self._expire(now)
+            return list(self._by_city.get(city_code.lower(), ()))
+
+    def cities(self, kind=None, now=None):
+        '''Return the sorted codes of the cities with alerts, only those
+        with an alert of a kind when given.'''
+        with self._lock:
+            self._expire(now)
+            if kind is None:
+                return sorted(self._by_city)
+            return sorted(self._by_kind.get(kind.upper(), ()))
+
+    def in_province(self, province, now=None):
+        '''Return the alerts of the cities of a province, e.g. 'ON'.'''
+        with self._lock:
+            self._expire(now)
+            return [alert
+                    for city_code in sorted(
+                        self._by_province.get(province.upper(), ()))
+                    for alert in self._by_city[city_code]]
+
+    def kinds(self, now=None):
+        '''Return {kind: number of cities} for every kind in effect.'''
+        with self._lock:
+            self._expire(now)
+            return dict((name, len(cities))
+                        for name, cities in self._by_kind.items())
+
+    def expire(self, now=None):
+        '''Drop the alerts whose expiry time has passed.'''
+        with self._lock:
+            self._expire(now)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(alerts) for alerts in self._by_city.values())
+
+    def __contains__(self, city_code):
+        with self._lock:
+            self._expire(None)
+            return city_code.lower() in self._by_city
+
+    def _add(self, city_code, alerts, schedule=True):
+        self._by_city[city_code] = tuple(alerts)
+        self._by_province.setdefault(
+            city_code.split('-')[0].upper(), set()).add(city_code)
+        for alert in alerts:
+            self._by_kind.setdefault(alert.kind, {}).setdefault(
+                city_code, []).append(alert)
+            if schedule:
+                heapq.heappush(self._expiry, (alert.expires,
+                                              next(self._sequence),
+                                              city_code, alert))
+
+    def _remove(self, city_code):
+        alerts = self._by_city.pop(city_code, ())
+        if not alerts:
+            return
+        province = city_code.split('-')[0].upper()
+        self._by_province[province].discard(city_code)
+        if not self._by_province[province]:
+            del self._by_province[province]
+        for name in set(alert.kind for alert in alerts):
+            del self._by_kind[name][city_code]
+            if not self._by_kind[name]:
+                del self._by_kind[name]
+
+    def _expire(self, now):
+        now = time.time() if now is None else now
+        while self._expiry and self._expiry[0][0] <= now:
+            _, _, city_code, alert = heapq.heappop(self._expiry)
+            alerts = self._by_city.get(city_code, ())
+            # entries of alerts replaced since are skipped
+            if alert in alerts:
+                remaining = [other for other in alerts if other != alert]
+                self._remove(city_code)
+                if remaining:
+                    # their own entries are still on the heap
+                    self._add(city_code, remaining, schedule=False)
@@ -0,0 +1,259 @@
+'''Streaming parser for weather.gc.ca atom feeds.
+
+This is the fast path behind Forecast._load.  It walks the document once
+with expat callbacks, so no generic tree is built, and produces the same
+structure as Forecast._parse applied to xmltodict output:
+
+    {'meta': {'lang': 'en-ca', 'title': ..., 'author': {...}, ...},
+     'Warnings and Watches': [{'title': ..., 'summary': ..., ...}],
+     'Current Conditions': [...],
+     'Weather Forecasts': [...]}
+
+The checks made by validators.META_SCHEMA and validators.ENTRY_SCHEMA are
+applied inline, and voluptuous.Invalid is raised where they would fail.
+Like voluptuous, values of keys the schemas remove (xmlns, link and the
+summary type) are dropped without being checked.
+'''
+from __future__ import absolute_import
+from collections import defaultdict
+from xml.parsers import expat
+
+from weathergc.utils import feed_updated
+
+AUTHOR = {'name': 'Environment Canada', 'uri': 'http://www.weather.gc.ca'}
+CATEGORIES = ('Weather Forecasts', 'Current Conditions',
+              'Warnings and Watches')
+META_TEXT_FIELDS = ('logo', 'rights', 'title', 'updated')
+ENTRY_TEXT_FIELDS = ('id', 'published', 'title', 'updated')
+ENTRY_FIELDS = ENTRY_TEXT_FIELDS + ('category', 'summary')
+
+# frame slots
+_NAME, _ATTRIB, _TEXT, _CHILDREN = range(4)
+
+
+def _invalid(message, path=None):
+    '''voluptuous.Invalid, imported only once a feed fails validation.'''
+    from voluptuous import Invalid
+    return Invalid(message, path=path)
+
+
+class AtomParser(object):
+    '''Incremental atom feed parser.
+
+    Data can be fed in chunks as it arrives from the network:
+
+        parser = AtomParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+        source = parser.close()
+    '''
+
+    def __init__(self):
+        self._source = defaultdict(list)
+        self._meta = None
+        self._author = None
+        self._entry = None
+        self._stack = []
+        self._text = []
+
+        self._parser = expat.ParserCreate()
+        # deliver each run of character data in one callback
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+
+    def feed(self, data):
+        '''Feed bytes or text of the document to the parser.'''
+        self._parser.Parse(data, False)
+
+    def close(self):
+        '''Finish parsing.
+
+        Returns:
+            dict with one key per section, as produced by Forecast._parse
+        '''
+        self._parser.Parse(b'', True)
+        if self._meta is None:
+            raise _invalid('document is not an atom feed')
+        return self._source
+
+    # expat callbacks
+
+    def _start(self, name, attrib):
+        depth = len(self._stack)
+        if depth:
+            self._stack[-1][_CHILDREN] += 1
+        self._text = []
+        self._stack.append([name, attrib, self._text, 0])
+
+        if depth == 0:
+            self._start_feed(name, attrib)
+        elif depth == 1 and name == 'entry':
+            self._entry = {}
+        elif depth == 1 and name == 'author':
+            self._author = {}
+
+    def _data(self, data):
+        self._text.append(data)
+
+    def _end(self, name):
+        frame = self._stack.pop()
+        depth = len(self._stack)
+        if depth:
+            self._text = self._stack[-1][_TEXT]
+
+        if depth == 1:
+            self._end_feed_child(frame)
+        elif depth == 2:
+            parent = self._stack[-1][_NAME]
+            if parent == 'entry':
+                self._end_entry_child(frame)
+            elif parent == 'author':
+                self._end_author_child(frame)
+
+    # section handlers
+
+    def _start_feed(self, name, attrib):
+        if name != 'feed':
+            raise _invalid('expected an atom feed, found %s' % name)
+
+        self._meta = {}
+        if 'xml:lang' in attrib:
+            if attrib['xml:lang'] != 'en-ca':
+                raise _invalid('not a valid value', path=['@xml:lang'])
+            self._meta['lang'] = attrib['xml:lang']
+        self._source['meta'] = self._meta
+
+    def _end_feed_child(self, frame):
+        name = frame[_NAME]
+        if name in META_TEXT_FIELDS:
+            self._set_once(self._meta, name, self._text_value(frame, [name]))
+        elif name == 'author':
+            if not self._is_mapping(frame):
+                raise _invalid('expected a dictionary', path=['author'])
+            self._set_once(self._meta, 'author', self._author)
+        elif name == 'entry':
+            self._end_entry(frame)
+
+    def _end_author_child(self, frame):
+        name = frame[_NAME]
+        if name in AUTHOR:
+            path = ['author', name]
+            value = self._text_value(frame, path)
+            if value != AUTHOR[name]:
+                raise _invalid('not a valid value', path=path)
+            self._set_once(self._author, name, value, path)
+
+    def _end_entry_child(self, frame):
+        name = frame[_NAME]
+        if name not in ENTRY_FIELDS:
+            return
+
+        path = ['entry', name]
+        if name in ENTRY_TEXT_FIELDS:
+            value = self._text_value(frame, path)
+        else:
+            if not self._is_mapping(frame):
+                raise _invalid('expected a dictionary', path=path)
+            attrib = frame[_ATTRIB]
+            if name == 'category':
+                value = attrib.get('term', '')
+                if 'term' in attrib and value not in CATEGORIES:
+                    raise _invalid('not a valid value', path=path + ['@term'])
+            else:
+                value = ''.join(frame[_TEXT]).strip()
+
+        self._set_once(self._entry, name, value, path)
+
+    def _end_entry(self, frame):
+        if not self._is_mapping(frame):
+            raise _invalid('expected a dictionary', path=['entry'])
+
+        entry = self._entry
+        self._entry = None
+        if 'category' not in entry:
+            raise _invalid('required key not provided',
+                          path=['entry', 'category'])
+
+        self._source[entry['category']].append(entry)
+
+    # helpers
+
+    @staticmethod
+    def _is_mapping(frame):
+        '''True when xmltodict would have produced a dict for frame.'''
+        return bool(frame[_ATTRIB] or frame[_CHILDREN])
+
+    @staticmethod
+    def _text_value(frame, path):
+        '''Return the text of a frame that must be a plain string.'''
+        text = ''.join(frame[_TEXT]).strip()
+        if frame[_ATTRIB] or frame[_CHILDREN] or not text:
+            raise _invalid('expected str', path=path)
+        return text
+
+    @staticmethod
+    def _set_once(obj, key, value, path=None):
+        '''Repeated elements would be a list in xmltodict and are invalid.'''
+        if key in obj:
+            raise _invalid('expected a single value', path=path or [key])
+        obj[key] = value
+
+
+class IfChanged(object):
+    '''Feed a parser only when the feed is not one already held.
+
+    The feed level <updated> stamp precedes the first entry, so it is in
+    the first chunk or two.  Those are held back until the stamp is found;
+    when it is the one given the rest of the feed is not parsed.
+
+        consumer = IfChanged(AtomParser(), forecast.updated)
+        ...
+        source = consumer.close()   # None when the feed was skipped
+    '''
+
+    def __init__(self, parser, updated):
+        self.parser = parser
+        self.updated = updated
+        self.unchanged = False
+        # chunks before the stamp was found, None once it has been
+        self._head = b''
+
+    def feed(self, data):
+        if self._head is None:
+            if not self.unchanged:
+                self.parser.feed(data)
+            return
+        self._head += data
+        stamp = feed_updated(self._head)
+        if stamp is None and b'<entry' not in self._head:
+            return
+        head, self._head = self._head, None
+        self.unchanged = stamp is not None and stamp == self.updated
+        if not self.unchanged:
+            self.parser.feed(head)
+
+    def close(self):
+        '''Finish parsing.
+
+        Returns:
+            the parser's result, or None when the feed was skipped
+        '''
+        if self.unchanged:
+            return None
+        if self._head is not None:
+            head, self._head = self._head, None
+            self.parser.feed(head)
+        return self.parser.close()
+
+
+def parse_feed(xml):
+    '''Parse a complete atom document given as bytes or text.
+
+    Returns:
+        dict with one key per section, as produced by Forecast._parse
+    '''
+    parser = AtomParser()
+    parser.feed(xml)
+    return parser.close()
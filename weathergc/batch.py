@@ -0,0 +1,107 @@
+'''Concurrent retrieval of many city forecasts.'''
+from __future__ import absolute_import
+from multiprocessing.pool import ThreadPool
+
+from weathergc.connection import ConnectionPool, fetch_feed
+from weathergc.forecast import Forecast
+
+DEFAULT_WORKERS = 16
+
+
+class BatchResult(object):
+    '''Outcome of a batch fetch.
+
+    Attributes:
+        forecasts: dict of city code to Forecast for every city that
+                   was retrieved and parsed successfully
+        errors: dict of city code to the exception raised for that city
+    '''
+
+    def __init__(self):
+        self.forecasts = {}
+        self.errors = {}
+
+    @property
+    def ok(self):
+        '''True when every city in the batch succeeded.'''
+        return not self.errors
+
+    def __len__(self):
+        return len(self.forecasts) + len(self.errors)
+
+
+class ForecastBatch(object):
+    '''Fetch and parse forecasts for many cities over pooled connections.
+
+    Feeds are downloaded by a pool of worker threads sharing keep-alive
+    HTTPS connections to weather.gc.ca, and parsed as they arrive.  A
+    failure for one city is recorded and does not abort the others.
+    '''
+
+    def __init__(self, city_codes, max_workers=DEFAULT_WORKERS, pool=None):
+        '''
+        Args:
+            city_codes: iterable of city codes, e.g. ['on-82', 'ns-19']
+            max_workers: number of concurrent downloads
+            pool: ConnectionPool to use; one sized to max_workers is
+                  created (and closed afterwards) when not provided
+        '''
+        self.city_codes = list(city_codes)
+        self.max_workers = max_workers
+        self._pool = pool
+
+    def __iter__(self):
+        '''Yield (city_code, forecast, error) tuples in completion order.
+
+        Exactly one of forecast and error is None for each city.
+        '''
+        pool = self._pool or ConnectionPool(maxsize=self.max_workers)
+        workers = ThreadPool(max(1, min(self.max_workers,
+                                        len(self.city_codes))))
+        try:
+            for result in workers.imap_unordered(
+                    lambda city_code: self._fetch_one(city_code, pool),
+                    self.city_codes):
+                yield result
+        finally:
+            workers.terminate()
+            if self._pool is None:
+                pool.close()
+
+    def fetch(self):
+        '''Retrieve every city in the batch.
+
+        Returns:
+            BatchResult
+        '''
+        result = BatchResult()
+        for city_code, forecast, error in self:
+            if error is None:
+                result.forecasts[city_code] = forecast
+            else:
+                result.errors[city_code] = error
+        return result
+
+    @staticmethod
+    def _fetch_one(city_code, pool):
+        try:
+            if not Forecast._valid_city_code(city_code):
+                raise ValueError('%s is not a valid city code.' % city_code)
+            xml = fetch_feed(city_code.lower(), pool)
+            return city_code, Forecast.from_xml(city_code, xml), None
+        except Exception as e:
+            return city_code, None, e
+
+
+def fetch_many(city_codes, max_workers=DEFAULT_WORKERS, pool=None):
+    '''Fetch and parse forecasts for many cities concurrently.
+
+    Args:
+        city_codes: iterable of city codes
+        max_workers: number of concurrent downloads
+        pool: optional ConnectionPool to share between batches
+
+    Returns:
+        BatchResult with per city forecasts and errors
+    '''
+    return ForecastBatch(city_codes, max_workers, pool).fetch()
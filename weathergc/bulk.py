@@ -0,0 +1,134 @@
+'''Bulk parsing of archived feeds on a process pool.
+
+Parsing is CPU bound, so archives are spread over worker processes rather
+than threads.  Workers also serialize their results, leaving the parent
+process little to do but write lines out.  Each result is a record:
+
+    {"file": "2016/09/on-82.xml", "city_code": "on-82", "forecast": {...}}
+
+or, when a file cannot be parsed:
+
+    {"file": "2016/09/on-82.xml", "city_code": "on-82", "error": "..."}
+'''
+from __future__ import absolute_import
+import json
+import os
+import re
+from multiprocessing import Pool
+
+from weathergc.forecast import Forecast
+
+DEFAULT_CHUNKSIZE = 16
+
+# archived file names start with the city code, e.g. on-82_201609102030.xml
+CITY_CODE_PATTERN = re.compile(r'^([a-z]{2}-[a-z]?[0-9]{1,3})(?![0-9])',
+                               re.IGNORECASE)
+
+
+def city_code_from_path(path):
+    '''Return the city code a feed file name starts with, or None.'''
+    match = CITY_CODE_PATTERN.match(os.path.basename(path))
+    return match.group(1).lower() if match else None
+
+
+def find_feeds(path):
+    '''Return sorted paths of all .xml files below path.'''
+    feeds = []
+    for root, dirs, files in os.walk(path):
+        feeds.extend(os.path.join(root, name) for name in files
+                     if name.endswith('.xml'))
+    return sorted(feeds)
+
+
+def parse_file(path, root=None, engine='expat'):
+    '''Parse one archived feed into a result record.
+
+    Args:
+        path: feed file
+        root: directory the file name in the record is relative to
+        engine: parser used for the feed
+
+    Returns:
+        dict record, see module documentation
+    '''
+    city_code = city_code_from_path(path)
+    record = {'file': os.path.relpath(path, root) if root else path,
+              'city_code': city_code}
+    try:
+        if city_code is None:
+            raise ValueError('no city code in file name')
+        forecast = Forecast.from_file(path, city_code, engine)
+        record['forecast'] = forecast.as_dict()
+    except Exception as e:
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    return record
+
+
+def _parse_file_task(args):
+    return parse_file(*args)
+
+
+def _parse_file_json_task(args):
+    record = parse_file(*args)
+    return json.dumps(record), 'error' in record
+
+
+def _imap(task, path, workers, chunksize, engine):
+    tasks = [(feed, path, engine) for feed in find_feeds(path)]
+    if workers == 1:
+        for result in map(task, tasks):
+            yield result
+        return
+
+    pool = Pool(workers)
+    try:
+        for result in pool.imap(task, tasks, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parse_directory(path, workers=None, chunksize=DEFAULT_CHUNKSIZE,
+                    engine='expat'):
+    '''Parse every feed below path on a pool of worker processes.
+
+    Results are streamed back in file name order, `chunksize` files per
+    round trip to a worker.
+
+    Args:
+        path: directory of archived feeds, searched recursively
+        workers: number of processes, defaults to the number of CPUs;
+                 1 parses in the current process
+        chunksize: number of files handed to a worker at once
+        engine: parser used for the feeds
+
+    Yields:
+        dict records, see module documentation
+    '''
+    return _imap(_parse_file_task, path, workers, chunksize, engine)
+
+
+def write_jsonl(path, out, workers=None, chunksize=DEFAULT_CHUNKSIZE,
+                engine='expat'):
+    '''Parse every feed below path and write one JSON record per line.
+
+    Args:
+        path: directory of archived feeds, searched recursively
+        out: text file object the lines are written to
+        workers: number of processes, defaults to the number of CPUs
+        chunksize: number of files handed to a worker at once
+        engine: parser used for the feeds
+
+    Returns:
+        tuple of (records written, records with errors)
+    '''
+    written = errors = 0
+    for line, failed in _imap(_parse_file_json_task, path, workers,
+                              chunksize, engine):
+        out.write(line)
+        out.write('\n')
+        written += 1
+        errors += failed
+    return written, errors
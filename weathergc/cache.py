@@ -0,0 +1,458 @@
+'''Feed caches used by Forecast.refresh.
+
+A cache stores, per city, the raw atom xml together with the parsed
+sections (Forecast._source) and the validators needed for a conditional
+request.  While an entry is younger than the cache's ttl, refresh() serves
+it without touching the network; once it expires the stored ETag and
+Last-Modified still let the next request be answered with 304.
+
+Backends share one interface:
+
+    get(city_code)   -> CacheEntry, or None when missing or expired
+    get_or_load(city_code, loader)
+                     -> CacheEntry, calling loader() to produce and store
+                        it when get() has none
+    set(entry)       store an entry, evicting least recently used ones
+                     when the size cap is exceeded
+    touch(city_code) mark an entry as fresh again, e.g. after a 304
+    peek(city_code)  -> CacheEntry even if expired, or None
+    clear()
+
+DirectoryCache and SQLiteCache persist entries across restarts.
+MemoryCache is meant to be shared by every Forecast in a process; it makes
+concurrent refreshes of one city wait for a single download and parse.
+
+    forecast = Forecast('on-82', cache=DirectoryCache('~/.weathergc'))
+    Forecast.default_cache = MemoryCache()
+'''
+from __future__ import absolute_import
+import abc
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+DEFAULT_TTL = 600
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class CacheEntry(namedtuple('CacheEntry', ['city_code', 'updated', 'xml',
+                                           'source', 'etag',
+                                           'last_modified', 'stored_at'])):
+    '''One cached feed.
+
+    Attributes:
+        city_code: code for the location
+        updated: feed level updated timestamp
+        xml: raw atom feed as bytes
+        source: parsed sections, as held in Forecast._source
+        etag: ETag header of the response the feed came from
+        last_modified: Last-Modified header of that response
+        stored_at: unix time the entry was stored or last revalidated
+    '''
+    __slots__ = ()
+
+    def fresh(self, ttl, now=None):
+        '''True when the entry is younger than ttl seconds; a ttl of None
+        never expires.'''
+        if ttl is None:
+            return True
+        return (now or time.time()) - self.stored_at < ttl
+
+
+class BaseCache(abc.ABC):
+    '''Common behaviour of the cache backends.
+
+    Backends implement peek, set, touch and clear.
+    '''
+
+    def __init__(self, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        '''
+        Args:
+            ttl: seconds an entry is served without revalidation, or None
+            max_bytes: total size of stored entries before least recently
+                       used ones are evicted, or None for no limit
+        '''
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+
+    def get(self, city_code):
+        entry = self.peek(city_code)
+        if entry is None or not entry.fresh(self.ttl):
+            return None
+        self._accessed(city_code)
+        return entry
+
+    def get_or_load(self, city_code, loader):
+        '''Return the fresh entry for city_code, or store and return the
+        entry produced by loader().'''
+        entry = self.get(city_code)
+        if entry is None:
+            entry = loader()
+            self.set(entry)
+        return entry
+
+    @abc.abstractmethod
+    def peek(self, city_code):
+        '''Return the entry for city_code even if expired, or None.'''
+
+    @abc.abstractmethod
+    def set(self, entry):
+        '''Store an entry, evicting least recently used ones when the size
+        cap is exceeded.'''
+
+    @abc.abstractmethod
+    def touch(self, city_code):
+        '''Mark an entry as fresh again, e.g. after a 304.'''
+
+    @abc.abstractmethod
+    def clear(self):
+        '''Remove every entry.'''
+
+    def _accessed(self, city_code):
+        '''Record a read for LRU bookkeeping.'''
+
+
+class DirectoryCache(BaseCache):
+    '''Cache in a local directory.
+
+    Each city is stored as <city_code>.xml with the raw feed and
+    <city_code>.json with the parsed sections and response headers.  The
+    modification time of the json file is the time the entry was stored,
+    that of the xml file the time it was last read.
+
+    Both files are replaced atomically, xml first.  The json records the
+    CRC-32 of its xml, so a reader that catches another process between
+    the two writes sees the mismatch and reads again instead of pairing
+    sections with the wrong feed.
+    '''
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        BaseCache.__init__(self, ttl, max_bytes)
+        self.path = os.path.expanduser(path)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._sizes = None
+
+    # reads of an entry that is being replaced before giving up on it
+    READ_ATTEMPTS = 3
+
+    def peek(self, city_code):
+        with self._lock:
+            for _ in range(self.READ_ATTEMPTS):
+                entry = self._read(city_code)
+                if entry is not False:
+                    return entry
+        return None
+
+    def set(self, entry):
+        json_path, xml_path = self._paths(entry.city_code)
+        document = json.dumps({'updated': entry.updated,
+                               'source': entry.source,
+                               'etag': entry.etag,
+                               'last_modified': entry.last_modified,
+                               'xml_crc': zlib.crc32(entry.xml)})
+        with self._lock:
+            self._write(xml_path, entry.xml)
+            self._write(json_path, document.encode('utf-8'))
+            if entry.stored_at:
+                os.utime(json_path, (entry.stored_at, entry.stored_at))
+            self._index()[entry.city_code] = (
+                len(entry.xml) + len(document))
+            self._evict(keep=entry.city_code)
+
+    def touch(self, city_code):
+        json_path, _ = self._paths(city_code)
+        try:
+            os.utime(json_path, None)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for city_code in list(self._index()):
+                self._remove(city_code)
+
+    def _accessed(self, city_code):
+        try:
+            os.utime(self._paths(city_code)[1], None)
+        except OSError:
+            pass
+
+    def _paths(self, city_code):
+        base = os.path.join(self.path, city_code)
+        return base + '.json', base + '.xml'
+
+    def _read(self, city_code):
+        '''The entry for city_code, None when missing, or False when the
+        xml does not belong with the json.'''
+        json_path, xml_path = self._paths(city_code)
+        try:
+            with open(json_path, 'rb') as f:
+                stored_at = os.fstat(f.fileno()).st_mtime
+                meta = json.loads(f.read().decode('utf-8'))
+            with open(xml_path, 'rb') as f:
+                xml = f.read()
+        except (IOError, OSError, ValueError):
+            return None
+        crc = meta.get('xml_crc')
+        if crc is not None and crc != zlib.crc32(xml):
+            return False
+        return CacheEntry(city_code, meta['updated'], xml, meta['source'],
+                          meta['etag'], meta['last_modified'], stored_at)
+
+    def _write(self, path, data):
+        import tempfile
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _index(self):
+        '''Sizes of the stored entries, read from disk on first use.'''
+        if self._sizes is None:
+            self._sizes = {}
+            for name in os.listdir(self.path):
+                city_code, ext = os.path.splitext(name)
+                if ext in ('.json', '.xml'):
+                    self._sizes[city_code] = self._sizes.get(city_code, 0) + \
+                        os.path.getsize(os.path.join(self.path, name))
+        return self._sizes
+
+    def _remove(self, city_code):
+        for path in self._paths(city_code):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._index().pop(city_code, None)
+
+    def _last_read(self, city_code):
+        try:
+            return os.path.getmtime(self._paths(city_code)[1])
+        except OSError:
+            return 0
+
+    def _evict(self, keep):
+        if self.max_bytes is None:
+            return
+        sizes = self._index()
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        for city_code in sorted(sizes, key=self._last_read):
+            if total <= self.max_bytes:
+                break
+            if city_code != keep:
+                total -= sizes[city_code]
+                self._remove(city_code)
+
+
+class SQLiteCache(BaseCache):
+    '''Cache in a single SQLite database file.'''
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS feeds (
+            city_code TEXT PRIMARY KEY,
+            updated TEXT,
+            xml BLOB NOT NULL,
+            source TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            stored_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            size INTEGER NOT NULL)'''
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        BaseCache.__init__(self, ttl, max_bytes)
+        self.path = os.path.expanduser(path)
+        import sqlite3
+        self._binary = sqlite3.Binary
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(self.SCHEMA)
+            self._db.execute('CREATE INDEX IF NOT EXISTS feeds_accessed '
+                             'ON feeds (accessed_at)')
+
+    def peek(self, city_code):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT updated, xml, source, etag, last_modified, stored_at '
+                'FROM feeds WHERE city_code = ?', (city_code,)).fetchone()
+        if row is None:
+            return None
+        updated, xml, source, etag, last_modified, stored_at = row
+        return CacheEntry(city_code, updated, bytes(xml), json.loads(source),
+                          etag, last_modified, stored_at)
+
+    def set(self, entry):
+        source = json.dumps(entry.source)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO feeds VALUES (?, ?, ?, ?, ?, ?, ?, '
+                '?, ?)',
+                (entry.city_code, entry.updated, self._binary(entry.xml),
+                 source, entry.etag, entry.last_modified,
+                 entry.stored_at or now, now,
+                 len(entry.xml) + len(source)))
+            self._evict(keep=entry.city_code)
+
+    def touch(self, city_code):
+        with self._lock, self._db:
+            self._db.execute('UPDATE feeds SET stored_at = ? '
+                             'WHERE city_code = ?', (time.time(), city_code))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM feeds')
+
+    def close(self):
+        self._db.close()
+
+    def _accessed(self, city_code):
+        with self._lock, self._db:
+            self._db.execute('UPDATE feeds SET accessed_at = ? '
+                             'WHERE city_code = ?', (time.time(), city_code))
+
+    def _evict(self, keep):
+        if self.max_bytes is None:
+            return
+        total = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM feeds').fetchone()[0]
+        rows = self._db.execute(
+            'SELECT city_code, size FROM feeds WHERE city_code != ? '
+            'ORDER BY accessed_at', (keep,)).fetchall()
+        evict = []
+        for city_code, size in rows:
+            if total <= self.max_bytes:
+                break
+            evict.append((city_code,))
+            total -= size
+        self._db.executemany('DELETE FROM feeds WHERE city_code = ?', evict)
+
+
+class _Flight(object):
+    '''A load in progress that other threads can wait for.'''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class MemoryCache(BaseCache):
+    '''Thread-safe in-process LRU cache.
+
+    Concurrent get_or_load calls for the same city share one call of the
+    loader ("single flight"): the first caller loads while the others wait
+    for its result.
+
+    Attributes:
+        hits: reads answered with a fresh entry
+        misses: reads that found no fresh entry and called the loader
+        coalesced: reads that waited for another thread's load
+        evictions: entries dropped to stay within max_entries
+    '''
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        '''
+        Args:
+            ttl: seconds an entry is served without revalidation, or None
+            max_entries: number of cities kept before the least recently
+                         used is evicted
+        '''
+        BaseCache.__init__(self, ttl, max_bytes=None)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._flights = {}
+        self.hits = self.misses = self.coalesced = self.evictions = 0
+
+    def stats(self):
+        '''Return the counters and current size as a dict.'''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'coalesced': self.coalesced,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries)}
+
+    def get(self, city_code):
+        with self._lock:
+            entry = self._get(city_code)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def get_or_load(self, city_code, loader):
+        with self._lock:
+            entry = self._get(city_code)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+            flight = self._flights.get(city_code)
+            leader = flight is None
+            if leader:
+                flight = self._flights[city_code] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry
+
+        try:
+            flight.entry = loader()
+            self.set(flight.entry)
+            return flight.entry
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[city_code]
+            flight.done.set()
+
+    def peek(self, city_code):
+        with self._lock:
+            return self._entries.get(city_code)
+
+    def set(self, entry):
+        with self._lock:
+            self._entries.pop(entry.city_code, None)
+            self._entries[entry.city_code] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, city_code):
+        with self._lock:
+            entry = self._entries.get(city_code)
+            if entry is not None:
+                self._entries[city_code] = entry._replace(
+                    stored_at=time.time())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, city_code):
+        '''Fresh entry for city_code, moved to the most recent end.'''
+        entry = self._entries.get(city_code)
+        if entry is None or not entry.fresh(self.ttl):
+            return None
+        del self._entries[city_code]
+        self._entries[city_code] = entry
+        return entry
@@ -0,0 +1,242 @@
+'''Catalogue of the weather.gc.ca city feeds.
+
+The catalogue ships with the package as cities.tsv, one city per line:
+
+    code <tab> province <tab> name <tab> latitude <tab> longitude
+
+and is read on first use.  It is built from the feeds themselves by
+weathergc/tests/build_cities.py.  The feeds carry no coordinates; they come
+from the Datamart site list or GeoNames, matched by name and province, and
+are empty for the cities neither lists under the same name.
+
+    city_codes('ON')                      # every city in Ontario
+    catalogue().get('on-82').name         # 'Kitchener-Waterloo'
+    catalogue().search('kitch')           # cities whose name starts so
+    catalogue().nearest(43.45, -80.49)    # on-82, the closest city with
+                                          # coordinates, if within 100 km
+'''
+from __future__ import absolute_import
+import bisect
+import math
+import os
+import threading
+import unicodedata
+from collections import namedtuple
+
+CATALOGUE_PATH = os.path.join(os.path.dirname(__file__), 'cities.tsv')
+
+PROVINCES = ('AB', 'BC', 'MB', 'NB', 'NL', 'NS', 'NT', 'NU', 'ON', 'PE',
+             'QC', 'SK', 'YT')
+
+EARTH_RADIUS = 6371.0
+# edge of the cells of the nearest-city grid, as a fraction of the earth's
+# radius; about 320 km
+CELL = 0.05
+# grid rings searched before falling back to every city with coordinates
+MAX_RING = 4
+# km beyond which nearest reports no city; the catalogue lacks coordinates
+# for some cities and every Alberta city, whose neighbours are far away
+DEFAULT_MAX_DISTANCE = 100
+
+
+class City(namedtuple('City', ['code', 'province', 'name', 'lat', 'lon'])):
+    '''One city feed; lat and lon are None when unknown.'''
+    __slots__ = ()
+
+
+def fold(name):
+    '''Lower case name without accents, for matching.'''
+    if not isinstance(name, type(u'')):
+        name = name.decode('utf-8')
+    decomposed = unicodedata.normalize('NFKD', name)
+    return u''.join(c for c in decomposed
+                    if not unicodedata.combining(c)).lower()
+
+
+def _unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon),
+            math.sin(lat))
+
+
+def _chord(a, b):
+    return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+
+def _cell(vector):
+    return tuple(int(math.floor(c / CELL)) for c in vector)
+
+
+class Catalogue(object):
+    '''Cities indexed by code, name prefix and position.'''
+
+    def __init__(self, cities):
+        '''
+        Args:
+            cities: iterable of City
+        '''
+        self.cities = list(cities)
+        self._by_code = dict((city.code, city) for city in self.cities)
+        self._by_province = {}
+        for city in self.cities:
+            self._by_province.setdefault(city.province, []).append(city)
+        self._names = sorted((fold(city.name), city.code)
+                             for city in self.cities)
+        self._grid = {}
+        self._located = []
+        for city in self.cities:
+            if city.lat is None or city.lon is None:
+                continue
+            vector = _unit_vector(city.lat, city.lon)
+            self._located.append((vector, city))
+            self._grid.setdefault(_cell(vector), []).append((vector, city))
+
+    @classmethod
+    def load(cls, path=CATALOGUE_PATH):
+        '''Read a catalogue file, see module documentation.'''
+        with open(path, 'rb') as f:
+            lines = f.read().decode('utf-8').splitlines()
+
+        cities = []
+        for line in lines:
+            if not line.strip():
+                continue
+            code, province, name, lat, lon = line.split(u'\t')
+            cities.append(City(str(code), str(province), name,
+                               float(lat) if lat else None,
+                               float(lon) if lon else None))
+        return cls(cities)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def __iter__(self):
+        return iter(self.cities)
+
+    def __contains__(self, code):
+        return code.lower() in self._by_code
+
+    def get(self, code):
+        '''Return the City with a code, or None.'''
+        return self._by_code.get(code.lower())
+
+    def in_province(self, province):
+        '''Return the cities of a province or territory, e.g. 'ON'.'''
+        return list(self._by_province.get(province.upper(), ()))
+
+    def search(self, prefix, limit=None):
+        '''Return cities whose name starts with prefix, ignoring case and
+        accents, in name order.'''
+        prefix = fold(prefix)
+        found = []
+        start = bisect.bisect_left(self._names, (prefix, ''))
+        for name, code in self._names[start:]:
+            if not name.startswith(prefix) or len(found) == limit:
+                break
+            found.append(self._by_code[code])
+        return found
+
+    def nearest(self, lat, lon, max_distance=DEFAULT_MAX_DISTANCE):
+        '''Return the closest city with coordinates.
+
+        Cities are bucketed in a grid over points on the unit sphere;
+        rings of cells around the position are searched until no unseen
+        cell can hold a closer city.
+
+        Args:
+            lat: latitude in degrees
+            lon: longitude in degrees
+            max_distance: km; a city farther away is not returned, None
+                          for no limit
+
+        Returns:
+            City, or None when no city with coordinates is within
+            max_distance
+        '''
+        if not self._located:
+            return None
+
+        target = _unit_vector(lat, lon)
+        centre = _cell(target)
+        limit = None if max_distance is None else \
+            2 * math.sin(min(math.pi, max_distance / EARTH_RADIUS) / 2)
+        best, best_chord = None, None
+        for ring in range(MAX_RING + 1):
+            for cell in self._ring(centre, ring):
+                for vector, city in self._grid.get(cell, ()):
+                    chord = _chord(vector, target)
+                    if best is None or chord < best_chord:
+                        best, best_chord = city, chord
+            # cities in cells beyond this ring are at least this far away
+            if best is not None and best_chord <= ring * CELL:
+                return self._within(best, best_chord, limit)
+            if limit is not None and limit <= ring * CELL:
+                return self._within(best, best_chord, limit)
+
+        for vector, city in self._located:
+            chord = _chord(vector, target)
+            if best is None or chord < best_chord:
+                best, best_chord = city, chord
+        return self._within(best, best_chord, limit)
+
+    @staticmethod
+    def _within(city, chord, limit):
+        if city is None or (limit is not None and chord > limit):
+            return None
+        return city
+
+    @staticmethod
+    def _ring(centre, ring):
+        '''Cells at Chebyshev distance ring from centre.'''
+        x, y, z = centre
+        span = range(-ring, ring + 1)
+        for dx in span:
+            for dy in span:
+                for dz in span:
+                    if max(abs(dx), abs(dy), abs(dz)) == ring:
+                        yield (x + dx, y + dy, z + dz)
+
+
+def distance(a, b):
+    '''Great circle distance in km between two (lat, lon) positions.'''
+    chord = _chord(_unit_vector(*a), _unit_vector(*b))
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, chord / 2))
+
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+
+def catalogue():
+    '''Return the packaged Catalogue, read on first use.'''
+    global _catalogue
+    with _catalogue_lock:
+        if _catalogue is None:
+            _catalogue = Catalogue.load()
+        return _catalogue
+
+
+def missing_provinces():
+    '''Return the provinces and territories without any catalogued city,
+    i.e. left out when the catalogue was built.'''
+    return [province for province in PROVINCES
+            if not catalogue().in_province(province)]
+
+
+def city_codes(province=None):
+    '''Return the city codes of one province or territory, or of all.
+
+    Args:
+        province: two letter abbreviation, e.g. 'ON' or 'on'; None for
+                  every city
+
+    Returns:
+        list of city codes, e.g. ['on-1', 'on-2', ...]; empty for a
+        province missing from the catalogue, see missing_provinces
+    '''
+    if province is None:
+        return [city.code for city in catalogue()]
+    if province.upper() not in PROVINCES:
+        raise ValueError('%s is not a known province or territory.'
+                         % province)
+    return [city.code for city in catalogue().in_province(province)]
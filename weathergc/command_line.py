@@ -1,5 +1,232 @@
-from forecast import Forecast
+'''Command line interface.
+
+    weathergc <city-code>              print the forecast for a city as JSON
+    weathergc <city-code>... [options] stream many cities as JSON Lines
+    weathergc parse <dir> [options]    parse archived feeds to JSON Lines
+    weathergc poll <city-code>...      keep polling cities, print changes
+    weathergc serve <city-code>...     serve cities over HTTP
+'''
+from __future__ import absolute_import, print_function
+import argparse
+import json
 import sys
 
-def main():
-    print(Forecast(sys.argv[1]).as_json())
+from weathergc.forecast import ENGINES, Forecast
+
+
+def parse(argv):
+    '''Bulk parse a directory of archived feeds.'''
+    from weathergc.bulk import DEFAULT_CHUNKSIZE, write_jsonl
+
+    parser = argparse.ArgumentParser(
+        prog='weathergc parse',
+        description='Parse every feed below a directory on a process pool '
+        'and write one JSON record per line.')
+    parser.add_argument('directory')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output',
+                        help='JSON Lines file to write (default: stdout)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='files handed to a worker at once')
+    parser.add_argument('--engine', choices=ENGINES, default='expat')
+    args = parser.parse_args(argv)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        written, errors = write_jsonl(args.directory, out, args.workers,
+                                      args.chunksize, args.engine)
+    finally:
+        if args.output:
+            out.close()
+
+    print('%d feeds parsed, %d errors' % (written, errors), file=sys.stderr)
+    return 1 if errors else 0
+
+
+def poll(argv):
+    '''Poll cities until interrupted, printing each changed forecast.'''
+    from weathergc import scheduler
+
+    parser = argparse.ArgumentParser(
+        prog='weathergc poll',
+        description='Poll cities on intervals adapted to how often their '
+        'feeds change, and print one JSON record per line whenever a '
+        'forecast changes.')
+    _add_city_arguments(parser)
+    parser.add_argument('-w', '--workers', type=int,
+                        default=scheduler.DEFAULT_WORKERS,
+                        help='concurrent requests')
+    parser.add_argument('--min-interval', type=float,
+                        default=scheduler.MIN_INTERVAL,
+                        help='shortest seconds between polls of a city')
+    parser.add_argument('--max-interval', type=float,
+                        default=scheduler.MAX_INTERVAL,
+                        help='longest seconds between polls of a city')
+    parser.add_argument('--warning-interval', type=float,
+                        default=scheduler.WARNING_INTERVAL,
+                        help='seconds between polls while warnings are '
+                        'in effect')
+    args = parser.parse_args(argv)
+    codes = _city_codes(parser, args)
+
+    def on_refresh(forecast, changed, error):
+        if error is not None:
+            print('%s: %s' % (forecast.city_code, error), file=sys.stderr)
+        elif changed:
+            print(json.dumps({'city_code': forecast.city_code,
+                              'forecast': forecast.as_dict()}))
+            sys.stdout.flush()
+
+    poller = scheduler.Poller(codes, args.workers, args.min_interval,
+                              args.max_interval, args.warning_interval,
+                              on_refresh)
+    invalid = [state for state in poller.cities.values()
+               if state.forecast is None]
+    for state in invalid:
+        print('%s: %s' % (state.city_code, state.error), file=sys.stderr)
+    if len(invalid) == len(poller.cities):
+        return 1
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _add_city_arguments(parser):
+    from weathergc.cities import PROVINCES
+
+    parser.add_argument('city_codes', nargs='*', metavar='city-code',
+                        help="city codes; '-' reads them from stdin")
+    parser.add_argument('-f', '--file', action='append', default=[],
+                        help="file listing one city code per line, '-' "
+                        'for stdin')
+    parser.add_argument('--province', action='append', default=[],
+                        type=str.upper, choices=PROVINCES,
+                        help='every city of a province or territory')
+    parser.add_argument('--all', action='store_true', help='every city')
+
+
+def _city_codes(parser, args):
+    '''Collect the city codes selected by _add_city_arguments, without
+    duplicates.'''
+    from weathergc.cities import city_codes, missing_provinces
+
+    missing = missing_provinces()
+    for province in args.province:
+        if province in missing:
+            parser.error('the catalogue lists no cities of %s' % province)
+    if args.all and missing:
+        print('the catalogue lists no cities of %s'
+              % ', '.join(missing), file=sys.stderr)
+
+    codes = [code for code in args.city_codes if code != '-']
+    files = list(args.file)
+    if '-' in args.city_codes:
+        files.append('-')
+    for name in files:
+        f = sys.stdin if name == '-' else open(name)
+        try:
+            codes.extend(line.strip() for line in f if line.strip())
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    for province in args.province:
+        codes.extend(city_codes(province))
+    if args.all:
+        codes.extend(city_codes())
+    if not codes:
+        parser.error('no city codes given')
+
+    unique, seen = [], set()
+    for code in codes:
+        if code not in seen:
+            seen.add(code)
+            unique.append(code)
+    return unique
+
+
+def dump(argv):
+    '''Fetch many cities concurrently and print one JSON record per line.'''
+    from weathergc.batch import DEFAULT_WORKERS, ForecastBatch
+    from weathergc.serializers import join_object, json_dumps
+
+    parser = argparse.ArgumentParser(
+        prog='weathergc',
+        description='Fetch forecasts concurrently and print one compact '
+        'JSON record per line as each city completes.')
+    _add_city_arguments(parser)
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help='concurrent downloads')
+    args = parser.parse_args(argv)
+    codes = _city_codes(parser, args)
+
+    errors = 0
+    for city_code, forecast, error in ForecastBatch(codes, args.workers):
+        if error is None:
+            record = join_object([
+                ('city_code', json_dumps(city_code)),
+                ('forecast', forecast.as_json(compact=True))])
+        else:
+            errors += 1
+            record = join_object([
+                ('city_code', json_dumps(city_code)),
+                ('error', json_dumps('%s: %s' % (type(error).__name__,
+                                                 error)))])
+        print(record)
+        sys.stdout.flush()
+    return 1 if errors else 0
+
+
+def serve(argv):
+    '''Serve cities over HTTP, refreshing them in the background.'''
+    from weathergc import scheduler, server
+
+    parser = argparse.ArgumentParser(
+        prog='weathergc serve',
+        description='Keep cities fresh in memory and serve them as JSON '
+        'at /city/<code>, /province/<pp> and /warnings.')
+    _add_city_arguments(parser)
+    parser.add_argument('--host', default=server.DEFAULT_HOST,
+                        help='address to listen on')
+    parser.add_argument('-p', '--port', type=int,
+                        default=server.DEFAULT_PORT, help='port to listen on')
+    parser.add_argument('-w', '--workers', type=int,
+                        default=scheduler.DEFAULT_WORKERS,
+                        help='concurrent requests to weather.gc.ca')
+    args = parser.parse_args(argv)
+    codes = _city_codes(parser, args)
+
+    print('serving %d cities on http://%s:%d/'
+          % (len(codes), args.host, args.port), file=sys.stderr)
+    try:
+        server.serve(codes, args.host, args.port, max_workers=args.workers)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+COMMANDS = {
+    'parse': parse,
+    'poll': poll,
+    'serve': serve,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(__doc__.strip(), file=sys.stderr)
+        return 2
+
+    if argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    if len(argv) > 1 or argv[0].startswith('-'):
+        return dump(argv)
+
+    print(Forecast(argv[0]).as_json())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+'''Keep-alive HTTPS connections to weather.gc.ca.
+
+Like urlopen, requests go through the HTTPS proxy of HTTPS_PROXY (or the
+system settings) unless NO_PROXY excludes the host, redirects are followed,
+and failures raise urllib.error.URLError.
+'''
+from __future__ import absolute_import
+import base64
+import socket
+import threading
+import zlib
+from collections import namedtuple
+from queue import Empty, Full, LifoQueue
+from urllib.error import URLError
+from urllib.parse import unquote, urljoin, urlsplit
+
+from weathergc import metrics
+
+HOST = 'weather.gc.ca'
+FEED_PATH = '/rss/city/%s_e.xml'
+# bytes read from the socket at a time
+CHUNK_SIZE = 16 * 1024
+REDIRECTS = (301, 302, 303, 307, 308)
+# redirects followed for one request, as urlopen
+MAX_REDIRECTS = 10
+
+
+def _http():
+    '''http.client, imported on the first request.'''
+    import http.client
+    return http.client
+
+
+def _proxy(host):
+    '''Return (host, port, tunnel headers) of the proxy urlopen would use
+    for https://host, or None for a direct connection.'''
+    from urllib.request import getproxies, proxy_bypass
+    proxy = getproxies().get('https')
+    if not proxy or proxy_bypass(host.split(':')[0]):
+        return None
+    if '://' not in proxy:
+        proxy = 'http://' + proxy
+    parts = urlsplit(proxy)
+    headers = {}
+    if parts.username:
+        credentials = '%s:%s' % (unquote(parts.username),
+                                 unquote(parts.password or ''))
+        headers['Proxy-Authorization'] = 'Basic %s' % base64.b64encode(
+            credentials.encode('utf-8')).decode('ascii')
+    return parts.hostname, parts.port, headers
+
+
+def decompressor(encoding):
+    '''Return a zlib decompressor for a Content-Encoding, or None when the
+    body is not compressed.'''
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return None
+
+
+# headers are keyed by lowercase name
+Response = namedtuple('Response', ['status', 'reason', 'headers', 'body'])
+
+
+class FetchError(URLError):
+    '''Raised when weather.gc.ca answers with an unexpected status.
+
+    A URLError, as urlopen raised before requests were pooled; code is the
+    status, as on urllib.error.HTTPError.
+    '''
+
+    def __init__(self, status, reason, path):
+        URLError.__init__(self, '%s %s for %s' % (status, reason, path))
+        self.status = self.code = status
+
+    def __str__(self):
+        return self.reason
+
+
+class ConnectionPool(object):
+    '''Thread-safe pool of persistent HTTPS connections to a single host.
+
+    Connections are handed out one per request and returned afterwards, so
+    a worker thread reuses an already negotiated TLS session instead of
+    paying for a new handshake on every feed.
+    '''
+
+    def __init__(self, host=HOST, maxsize=10, timeout=30):
+        '''
+        Args:
+            host: host name every request is sent to
+            maxsize: number of idle connections kept open for reuse
+            timeout: socket timeout in seconds
+        '''
+        self.host = host
+        self.timeout = timeout
+        self._idle = LifoQueue(maxsize)
+
+    def get(self, path):
+        '''Issue a GET for path and return the response body.
+
+        Args:
+            path: request path, e.g. /rss/city/on-82_e.xml
+
+        Returns:
+            bytes of the response body
+        '''
+        response = self.request(path)
+        if response.status != 200:
+            raise FetchError(response.status, response.reason, path)
+        return response.body
+
+    def request(self, path, headers=None, consumer=None):
+        '''Issue a GET for path with extra request headers.
+
+        A connection that was closed by the server while idle is retried
+        once on a fresh connection.  304 Not Modified is returned like a
+        success so conditional requests can be answered from a cache.
+        Redirects are followed, to other hosts over connections that are
+        not pooled.
+
+        gzip transfer is requested and undone on the fly.  The body is
+        read in chunks of CHUNK_SIZE, and with a consumer each decoded
+        chunk of a 200 response is handed to consumer.feed(chunk) as it
+        arrives, so e.g. a parser can work while the rest downloads.
+
+        Args:
+            path: request path, e.g. /rss/city/on-82_e.xml
+            headers: dict of additional request headers
+            consumer: object with a feed(bytes) method
+
+        Returns:
+            Response; body is the complete decoded body
+
+        Raises:
+            FetchError: the final response is not 200 or 304
+            URLError: the request failed, e.g. the host was unreachable
+        '''
+        pool, others = self, []
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                try:
+                    response = pool._exchange(path, headers, consumer)
+                except (_http().HTTPException, socket.error) as e:
+                    if isinstance(e, URLError):
+                        raise
+                    raise URLError(e)
+                if response.status not in REDIRECTS:
+                    break
+                location = urlsplit(urljoin(
+                    'https://%s%s' % (pool.host, path),
+                    response.headers.get('location', '')))
+                if location.scheme != 'https':
+                    raise FetchError(response.status, response.reason, path)
+                if location.netloc != pool.host:
+                    pool = ConnectionPool(location.netloc, 1, self.timeout)
+                    others.append(pool)
+                path = location.path + (
+                    '?' + location.query if location.query else '')
+            else:
+                raise FetchError(response.status, 'too many redirects', path)
+        finally:
+            for other in others:
+                other.close()
+
+        if response.status not in (200, 304):
+            raise FetchError(response.status, response.reason, path)
+        return response
+
+    def _exchange(self, path, headers, consumer):
+        '''One request and its response, of any status.'''
+        with metrics.timed('fetch') as timer:
+            conn, reused = self._checkout()
+            try:
+                response = self._request(conn, path, headers)
+            except (_http().HTTPException, socket.error):
+                conn.close()
+                if not reused:
+                    raise
+                conn, reused = self._new_connection(), False
+                response = self._request(conn, path, headers)
+
+            try:
+                body, received = self._read_body(
+                    response, consumer if response.status == 200 else None)
+            except Exception:
+                conn.close()
+                raise
+            finally:
+                # counted by the consumer under its own stage, see
+                # metrics.TimedConsumer
+                timer.exclude(getattr(consumer, 'seconds', 0))
+        if metrics.recorder is not None:
+            metrics.recorder.downloaded(response.status, received)
+        if response.will_close:
+            conn.close()
+        else:
+            self._checkin(conn)
+        return Response(response.status, response.reason,
+                        dict((name.lower(), value)
+                             for name, value in response.getheaders()),
+                        body)
+
+    def close(self):
+        '''Close all idle connections.'''
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
+    @staticmethod
+    def _read_body(response, consumer):
+        '''Read, decode and pass on the body in chunks.
+
+        Returns:
+            tuple of (decoded body, bytes received)
+        '''
+        encoding = (response.getheader('content-encoding') or '').lower()
+        decoder = decompressor(encoding)
+        chunks = []
+        received = 0
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            received += len(chunk)
+            if decoder is not None:
+                chunk = decoder.decompress(chunk)
+            if chunk:
+                chunks.append(chunk)
+                if consumer is not None:
+                    consumer.feed(chunk)
+        if decoder is not None:
+            chunk = decoder.flush()
+            if chunk:
+                chunks.append(chunk)
+                if consumer is not None:
+                    consumer.feed(chunk)
+        return b''.join(chunks), received
+
+    def _request(self, conn, path, headers=None):
+        request_headers = {'Connection': 'keep-alive',
+                           'Accept-Encoding': 'gzip'}
+        request_headers.update(headers or {})
+        conn.request('GET', path, headers=request_headers)
+        return conn.getresponse()
+
+    def _new_connection(self):
+        proxy = _proxy(self.host)
+        if proxy is None:
+            return _http().HTTPSConnection(self.host, timeout=self.timeout)
+        host, port, headers = proxy
+        conn = _http().HTTPSConnection(host, port, timeout=self.timeout)
+        conn.set_tunnel(self.host, headers=headers)
+        return conn
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait(), True
+        except Empty:
+            return self._new_connection(), False
+
+    def _checkin(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+    '''Return the process-wide pool shared by all Forecast objects.'''
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ConnectionPool()
+        return _default_pool
+
+
+def fetch_feed(city_code, pool=None):
+    '''Download the raw atom feed for a city.
+
+    Args:
+        city_code: code for the location, e.g. on-82
+        pool: ConnectionPool to use, defaults to the shared pool
+
+    Returns:
+        bytes of the atom xml
+    '''
+    pool = pool or default_pool()
+    return pool.get(FEED_PATH % city_code)
+
+
+def fetch_feed_conditional(city_code, etag=None, last_modified=None,
+                           pool=None, consumer=None):
+    '''Download the atom feed for a city unless it is unchanged.
+
+    Args:
+        city_code: code for the location, e.g. on-82
+        etag: ETag header of the previously retrieved feed
+        last_modified: Last-Modified header of the previously retrieved feed
+        pool: ConnectionPool to use, defaults to the shared pool
+        consumer: object whose feed(bytes) receives the feed as it
+                  downloads, e.g. a weathergc.atom.AtomParser
+
+    Returns:
+        Response; status is 304 and body empty when the feed is unchanged
+    '''
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    pool = pool or default_pool()
+    return pool.request(FEED_PATH % city_code, headers, consumer)
@@ -0,0 +1,77 @@
+'''Changes between two generations of a forecast.
+
+Entries are matched by their atom id, which weather.gc.ca stamps with the
+issue time, e.g. tag:weather.gc.ca,2013-04-16:on-82_cc:20160910202900.  A
+new current conditions reading or a newly issued warning therefore shows up
+as an added entry, the entry it replaces as removed, and a correction
+re-issued under the same id as updated.
+
+    for change in iter_changes(old_source, new_source):
+        print(change.section, change.kind, change.new or change.old)
+
+old and new are entries in the final structure of Forecast.as_dict.
+'''
+from __future__ import absolute_import
+from collections import namedtuple
+
+from weathergc import validators
+
+ADDED = 'added'
+REMOVED = 'removed'
+UPDATED = 'updated'
+
+SECTIONS = ('Warnings and Watches', 'Current Conditions', 'Weather Forecasts')
+
+Change = namedtuple('Change', ['section', 'kind', 'id', 'old', 'new'])
+
+
+def _schemas():
+    return {'Warnings and Watches': validators.WW_SCHEMA,
+            'Current Conditions': validators.CC_SCHEMA,
+            'Weather Forecasts': validators.WF_SCHEMA}
+
+
+def _entry_key(entry):
+    # feeds cached before ids were kept have none; the title is the best
+    # stand-in
+    return entry.get('id') or entry.get('title')
+
+
+def _keyed(entries):
+    keyed = {}
+    order = []
+    for entry in entries:
+        key = _entry_key(entry)
+        if key not in keyed:
+            order.append(key)
+        keyed[key] = entry
+    return keyed, order
+
+
+def iter_changes(old, new):
+    '''Yield the entries that differ between two parsed feeds.
+
+    Args:
+        old: _source of the previous generation, or None
+        new: _source of the current generation
+
+    Yields:
+        Change tuples, section by section, removals first
+    '''
+    schemas = _schemas()
+    for section in SECTIONS:
+        old_entries, old_order = _keyed(old.get(section, ()) if old else ())
+        new_entries, new_order = _keyed(new.get(section, ()))
+        schema = schemas[section]
+
+        for key in old_order:
+            if key not in new_entries:
+                yield Change(section, REMOVED, key,
+                             schema(old_entries[key]), None)
+        for key in new_order:
+            entry = new_entries[key]
+            if key not in old_entries:
+                yield Change(section, ADDED, key, None, schema(entry))
+            elif entry != old_entries[key]:
+                yield Change(section, UPDATED, key,
+                             schema(old_entries[key]), schema(entry))
@@ -1,19 +1,30 @@
 '''Main entry point for the weathergc package.'''
 from __future__ import absolute_import
+import hashlib
 import json
+import os
 import re
 import sys
+import time
 from collections import defaultdict
 
-import xmltodict
+from weathergc import metrics, validators
+from weathergc.atom import AtomParser, IfChanged, parse_feed
+from weathergc.cache import CacheEntry
+from weathergc.connection import fetch_feed_conditional
+from weathergc.diff import iter_changes
+from weathergc.observations import parse_observation
+from weathergc.records import ForecastRecord
+from weathergc.serializers import dumps, join_object
+from weathergc.utils import copy_tree, feed_updated, list_iter
 
-from weathergc import validators
-from weathergc.utils import list_iter
+# 'expat' is the streaming parser in weathergc.atom, 'xmltodict' the
+# original xmltodict + voluptuous path through Forecast._parse.
+ENGINES = ('expat', 'xmltodict')
 
-try:
-    from urllib.request import urlopen
-except ImportError:
-    from urllib import urlopen
+# sections of the final structure, in output order
+SECTIONS = ('meta', 'Warnings and Watches', 'Current Conditions',
+            'Weather Forecasts')
 
 
 class Forecast(object):
@@ -27,13 +38,27 @@ class Forecast(object):
     High level flow:
     - constructor accepts city-code, which calls refresh to retrieve the data
       and transform it into a Python dict.  _refresh can update it later too.
+      from_xml / from_file build the same object from a feed on hand.
     - _parse handles basic validation and re-organizes the data structure to
       group entries into sections, and stores as _source
     - section specific _transform methods further refine and annotate the
       data to a point where it's ready for final use.
     '''
 
-    def __init__(self, city_code):
+    # cache used by every Forecast created without an explicit one, e.g. a
+    # weathergc.cache.MemoryCache shared by all request handlers
+    default_cache = None
+
+    # name of the method producing each section, see _section
+    _TRANSFORMS = {
+        'meta': '_transform_meta',
+        'Warnings and Watches': '_transform_warnings_and_watches',
+        'Current Conditions': '_transform_current_conditions',
+        'Weather Forecasts': '_transform_weather_forecasts',
+    }
+
+    def __init__(self, city_code, xml=None, engine='expat', lazy=False,
+                 cache=None, on_change=None, history=None):
         '''Constructor to create an instance of Forecast.
 
         Environment Canada uses 4-5 character city codes to identify
@@ -46,30 +71,383 @@ class Forecast(object):
 
         Args:
             city_code: code for the location
+            xml: raw atom feed already downloaded for this city; when given
+                 it is parsed instead of fetching from the website
+            engine: parser used for the feed, one of ENGINES
+            lazy: when True and no xml is given, the feed is not fetched
+                  until the data is first accessed
+            cache: feed cache consulted by refresh, see weathergc.cache;
+                   defaults to Forecast.default_cache
+            on_change: called as on_change(forecast, changes) whenever new
+                       data replaces the data held, with the list of
+                       weathergc.diff.Change entries between the two; the
+                       first load reports every entry as added
+            history: weathergc.history.History that records the current
+                     conditions every time new data is loaded
         '''
         if self._valid_city_code(city_code):
             self._city_code = city_code.lower()
         else:
             raise ValueError('%s is not a valid city code.' % city_code)
 
+        if engine not in ENGINES:
+            raise ValueError('%s is not a valid parser engine.' % engine)
+        self._engine = engine
+        self._cache = cache if cache is not None else self.default_cache
+        self.on_change = on_change
+        self.history = history
+
         self._source = None
-        self.refresh()
+        self._memo_source = None
+        self._memo_store = {}
+        self._etag = None
+        self._last_modified = None
+        self._digest = None
+        self._updated = None
+        if xml is not None:
+            self._load(xml)
+        elif not lazy:
+            self.refresh()
+
+    @classmethod
+    def from_xml(cls, city_code, xml, engine='expat'):
+        '''Create a Forecast from an atom feed that is already in memory.
+
+        No network request is made.
+
+        Args:
+            city_code: code for the location the feed belongs to
+            xml: bytes or text of the atom feed
+            engine: parser used for the feed, one of ENGINES
+        '''
+        return cls(city_code, xml=xml, engine=engine)
+
+    @classmethod
+    def from_file(cls, path, city_code=None, engine='expat'):
+        '''Create a Forecast from an atom feed saved on disk.
+
+        No network request is made.
 
-    def as_json(self):
-        return json.dumps(self._collate(), indent=4)
+        Args:
+            path: file containing the atom feed
+            city_code: code for the location; defaults to the file name
+                       without its extension, e.g. data/on-82.xml -> on-82
+            engine: parser used for the feed, one of ENGINES
+        '''
+        if city_code is None:
+            city_code = os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'rb') as f:
+            return cls(city_code, xml=f.read(), engine=engine)
+
+    def as_json(self, compact=False):
+        '''Return the data as a JSON string.
+
+        Args:
+            compact: when True, without indentation or spaces, stitched
+                     from the section fragments of json_fragment
+        '''
+        self._ensure_loaded()
+        memo = self._memo()
+        if compact:
+            if 'compact_json' not in memo:
+                memo['compact_json'] = join_object(
+                    (section, self.json_fragment(section))
+                    for section in SECTIONS)
+            return memo['compact_json']
+
+        if 'json' not in memo:
+            collated = self._collated()
+            with metrics.timed('serialize'):
+                memo['json'] = json.dumps(collated, indent=4)
+        return memo['json']
+
+    def json_fragment(self, section):
+        '''Return one section of as_dict() as compact JSON.
+
+        Encoded once per refresh by weathergc.serializers.dumps, so
+        fragments can be stitched into larger responses for free.
+
+        Args:
+            section: 'meta', 'Warnings and Watches', 'Current Conditions'
+                     or 'Weather Forecasts'
+        '''
+        data = self._section(section)
+        fragments = self._memo().setdefault('fragments', {})
+        if section not in fragments:
+            with metrics.timed('serialize'):
+                fragments[section] = dumps(data)
+        return fragments[section]
 
     def as_dict(self):
-        return self._collate()
+        return copy_tree(self._collated())
+
+    def as_records(self):
+        '''Return the data as compact, immutable records.
+
+        See weathergc.records; ForecastRecord.to_dict() gives back the
+        structure of as_dict().
+        '''
+        # loads a lazy forecast before the memo of its data is taken
+        collated = self._collated()
+        memo = self._memo()
+        if 'records' not in memo:
+            memo['records'] = ForecastRecord.create(collated)
+        return memo['records']
+
+    @property
+    def observation(self):
+        '''Current Conditions as typed values, see weathergc.observations.
+
+        Parsed once per refresh.  None when the feed has no current
+        conditions.
+        '''
+        conditions = self._section('Current Conditions')
+        memo = self._memo()
+        if 'observation' not in memo:
+            memo['observation'] = parse_observation(
+                conditions[0].get('data') or {}) if conditions else None
+        return memo['observation']
+
+    @property
+    def meta(self):
+        '''Feed level information, as in as_dict()['meta'].'''
+        return copy_tree(self._section('meta'))
+
+    @property
+    def warnings(self):
+        '''Warnings and Watches entries, as in as_dict().'''
+        return copy_tree(self._section('Warnings and Watches'))
+
+    @property
+    def current_conditions(self):
+        '''Current Conditions entries, as in as_dict().'''
+        return copy_tree(self._section('Current Conditions'))
+
+    @property
+    def forecasts(self):
+        '''Weather Forecasts entries, one per period, as in as_dict().'''
+        return copy_tree(self._section('Weather Forecasts'))
+
+    @property
+    def city_code(self):
+        '''Code for the location, in lower case.'''
+        return self._city_code
+
+    @property
+    def updated(self):
+        '''Feed level updated timestamp of the data currently held.'''
+        self._ensure_loaded()
+        return self._updated
 
     def refresh(self):
-        '''Retrieve data from website, parse and store in _source.'''
-        url = 'https://weather.gc.ca/rss/city/%s_e.xml' % self._city_code
+        '''Retrieve data from website, parse and store in _source.
+
+        The request is conditional on the ETag / Last-Modified of the
+        previous response.  When the server answers 304, or the feed body
+        or its updated timestamp is unchanged, parsing is skipped entirely.
+
+        With a cache, a fresh cache entry is used without any request, and
+        a feed that has to be downloaded is stored in the cache for other
+        Forecast objects and later runs.
+
+        Returns:
+            True if new data was loaded, False if the feed was unchanged.
+        '''
+        if self._cache is None:
+            return self._download()
+        return self._load_entry(
+            self._cache.get_or_load(self._city_code, self._download_entry))
+
+    def _download(self):
+        '''Conditionally download and load the feed.
+
+        Returns:
+            True if new data was loaded, False if the feed was unchanged.
+        '''
+        response, source = self._fetch(
+            self._etag, self._last_modified,
+            self._updated if self._source is not None else None)
+        if response.status == 304:
+            return False
+
+        changed = self._load_if_changed(response.body, source)
+        # kept only once the feed they describe has been loaded, so a feed
+        # that fails to parse is downloaded again in full
+        self._etag = response.headers.get('etag')
+        self._last_modified = response.headers.get('last-modified')
+        return changed
+
+    def _fetch(self, etag, last_modified, updated=None):
+        '''Conditional request for the feed, parsed while it downloads.
+
+        With the expat engine each chunk of the body is fed to an
+        AtomParser as it arrives, so parsing overlaps the transfer.  A feed
+        whose <updated> stamp is the one held is not parsed at all.
+
+        Args:
+            etag: ETag of the feed held
+            last_modified: Last-Modified of the feed held
+            updated: feed level updated timestamp of the feed held
 
-        response = urlopen(url)
-        xml = response.read()
+        Returns:
+            tuple of (Response, parsed source or None when the body was
+            not parsed)
+        '''
+        parser = None
+        if self._engine == 'expat':
+            parser = AtomParser()
+            if updated is not None:
+                parser = IfChanged(parser, updated)
+            if metrics.recorder is not None:
+                parser = metrics.TimedConsumer(parser)
+        try:
+            response = fetch_feed_conditional(
+                self._city_code, etag, last_modified, consumer=parser)
+            if parser is None or response.status != 200:
+                return response, None
+            source = parser.close()
+        except Exception as e:
+            self._record_failure('parse', e)
+            raise
+
+        if metrics.recorder is not None:
+            metrics.recorder.observe('parse', parser.seconds)
+            if source is not None:
+                metrics.recorder.parsed(self._city_code, source)
+        return response, source
+
+    def _download_entry(self):
+        '''Produce a cache entry for a city the cache has no fresh entry for.
+
+        An expired entry is revalidated with a conditional request and
+        reused if the feed has not changed.
+
+        Returns:
+            CacheEntry
+        '''
+        stale = self._cache.peek(self._city_code)
+        # without an entry to reuse, e.g. after it was evicted, a 304 would
+        # leave nothing to build the new entry from
+        if stale is not None:
+            etag, last_modified = stale.etag, stale.last_modified
+        else:
+            etag, last_modified = None, None
+
+        response, source = self._fetch(
+            etag, last_modified, stale.updated if stale is not None else None)
+        now = time.time()
+        if response.status == 304:
+            return stale._replace(stored_at=now)
+
+        etag = response.headers.get('etag')
+        last_modified = response.headers.get('last-modified')
+        xml = response.body
+        if stale is not None and (
+                self._feed_digest(xml) == self._feed_digest(stale.xml) or
+                feed_updated(xml) == stale.updated):
+            return stale._replace(etag=etag, last_modified=last_modified,
+                                  stored_at=now)
+
+        if source is None:
+            source = self._parse_xml(xml)
+        return CacheEntry(self._city_code, source['meta'].get('updated'),
+                          xml, source, etag, last_modified, now)
+
+    def _load_entry(self, entry):
+        '''Take over the data held by a cache entry.
+
+        Returns:
+            True if the entry differs from the data already held.
+        '''
+        self._etag = entry.etag
+        self._last_modified = entry.last_modified
+        if self._source is not None and (entry.source is self._source or
+                                         entry.updated == self._updated):
+            return False
+
+        self._store(entry.source, self._feed_digest(entry.xml))
+        return True
+
+    def _load_if_changed(self, xml, source=None):
+        '''Load xml unless it is the feed already held.
+
+        Args:
+            xml: raw atom feed
+            source: xml already parsed, see _load
+
+        Returns:
+            True if xml was parsed and stored, False otherwise.
+        '''
+        if self._source is not None:
+            if self._feed_digest(xml) == self._digest:
+                return False
+            updated = feed_updated(xml)
+            if updated is not None and updated == self._updated:
+                return False
 
-        obj = xmltodict.parse(xml, dict_constructor=dict)
-        self._source = self._parse(obj)
+        self._load(xml, source)
+        return True
+
+    def _load(self, xml, source=None):
+        '''Parse the raw atom feed and store in _source.
+
+        Args:
+            xml: raw atom feed
+            source: xml already parsed, e.g. while it downloaded; parsed
+                    here when None
+        '''
+        if source is None:
+            source = self._parse_xml(xml)
+        self._store(source, self._feed_digest(xml))
+
+    def _store(self, source, digest):
+        '''Replace _source, reporting the changes to on_change and the
+        current conditions to history.'''
+        previous = self._source
+        self._source = source
+        self._digest = digest
+        self._updated = source['meta'].get('updated')
+        if self.on_change is not None:
+            changes = list(iter_changes(previous, source))
+            if changes:
+                self.on_change(self, changes)
+        if self.history is not None:
+            self.history.record(self)
+
+    def _parse_xml(self, xml):
+        '''Parse the raw atom feed with the selected engine.
+
+        Returns:
+            dict with one key per section, see _parse
+        '''
+        with metrics.timed('parse'):
+            try:
+                if self._engine == 'xmltodict':
+                    import xmltodict
+                    source = self._parse(
+                        xmltodict.parse(xml, dict_constructor=dict))
+                else:
+                    source = parse_feed(xml)
+            except Exception as e:
+                self._record_failure('parse', e)
+                raise
+
+        if metrics.recorder is not None:
+            metrics.recorder.parsed(self._city_code, source)
+        return source
+
+    def _record_failure(self, stage, error):
+        '''Count a validation error with the enabled metrics recorder.'''
+        if metrics.recorder is not None:
+            from voluptuous import Invalid
+            if isinstance(error, Invalid):
+                metrics.recorder.failed(self._city_code, stage)
+
+    @staticmethod
+    def _feed_digest(xml):
+        if not isinstance(xml, bytes):
+            xml = xml.encode('utf-8')
+        return hashlib.sha1(xml).digest()
 
     @staticmethod
     def _valid_city_code(city_code):
@@ -149,7 +527,7 @@ class Forecast(object):
     def _transform_meta(self):
         '''Transform meta section into final structure.'''
         category = 'meta'
-        processed = self._source[category]
+        processed = dict(self._source[category])
         processed['badge'] = self._forecast_badge_url()
 
         return {category: processed}
@@ -174,11 +552,55 @@ class Forecast(object):
         Returns:
             dict of combined, processed results.
         '''
-        collated = self._transform_meta()
-        collated.update(self._transform_warnings_and_watches())
-        collated.update(self._transform_current_conditions())
-        collated.update(self._transform_weather_forecasts())
-        return collated
+        with metrics.timed('collate'):
+            return dict((section, self._section(section))
+                        for section in SECTIONS)
+
+    def _collated(self):
+        '''Memoized result of _collate for the data currently held.
+
+        Callers must not modify the returned object; as_dict hands out a
+        copy.
+        '''
+        self._ensure_loaded()
+        memo = self._memo()
+        if 'collated' not in memo:
+            memo['collated'] = self._collate()
+        return memo['collated']
+
+    def _section(self, section):
+        '''Memoized final structure of one section.
+
+        Only that section's transform runs, so reading one section does
+        not pay for the others.  Callers must not modify the result.
+        '''
+        self._ensure_loaded()
+        sections = self._memo().setdefault('sections', {})
+        if section not in sections:
+            transform = getattr(self, self._TRANSFORMS[section])
+            with metrics.timed('validate'):
+                try:
+                    sections[section] = transform()[section]
+                except Exception as e:
+                    self._record_failure('validate', e)
+                    raise
+        return sections[section]
+
+    def _ensure_loaded(self):
+        '''Fetch the feed on first access for objects created lazily.'''
+        if self._source is None:
+            self.refresh()
+
+    def _memo(self):
+        '''Store for output derived from _source.
+
+        The store is discarded whenever _source is replaced, so everything
+        in it lives exactly as long as one refresh generation.
+        '''
+        if self._memo_source is not self._source:
+            self._memo_source = self._source
+            self._memo_store = {}
+        return self._memo_store
 
 
 if __name__ == '__main__':
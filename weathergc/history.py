@@ -0,0 +1,311 @@
+'''Append-only history of Current Conditions readings.
+
+Every city has one file, <city_code>.obs, of fixed size records: one
+little-endian double per column in COLUMNS, the observation time in seconds
+since the epoch followed by the numeric readings of
+weathergc.observations.Observation, NaN where a reading is absent.  Records
+are only ever appended, in observation time order, so a reading costs one
+write and a record torn by a crash is dropped the next time the file is
+read.
+
+In memory each city is held as one array('d') per column, so a range query
+is two binary searches and a slice; only the most recently used cities are
+held.  With NumPy installed, memmap maps a city's file as a structured
+array without reading it.
+
+    history = History('~/.weathergc/history')
+    f = Forecast('on-82', history=history)  # every refresh is recorded
+    series = history.series('on-82', start, end)
+    series['temperature']                   # array('d', [24.6, ...])
+    series.resample(3600, 'max')            # hourly maxima
+    history.memmap('on-82')['temperature']  # numpy.memmap column
+'''
+from __future__ import absolute_import
+import bisect
+import math
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+from weathergc.observations import TIMEZONES
+
+NUMERIC = ('temperature', 'dewpoint', 'humidity', 'humidex', 'wind_chill',
+           'pressure', 'wind_speed', 'wind_gust', 'visibility', 'air_quality')
+COLUMNS = ('time',) + NUMERIC
+
+RECORD = struct.Struct('<%dd' % len(COLUMNS))
+# description of a record for numpy.dtype
+DTYPE = [(column, '<f8') for column in COLUMNS]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=TIMEZONES['UTC'])
+NAN = float('nan')
+
+# cities whose readings are kept in memory
+DEFAULT_MAX_CITIES = 100
+
+
+def timestamp(value):
+    '''Seconds since the epoch of an aware datetime; numbers are returned
+    unchanged.'''
+    if isinstance(value, datetime):
+        return (value - EPOCH).total_seconds()
+    return value
+
+
+def _mean(values):
+    return sum(values) / len(values)
+
+
+AGGREGATES = {
+    'mean': _mean,
+    'min': min,
+    'max': max,
+    'first': lambda values: values[0],
+    'last': lambda values: values[-1],
+    'count': len,
+}
+
+
+def _column():
+    return array('d')
+
+
+class Series(object):
+    '''Readings of one city in time order, one array('d') per column.'''
+
+    def __init__(self, columns=None):
+        '''
+        Args:
+            columns: dict of column name to array('d') of equal length;
+                     empty columns when None
+        '''
+        if columns is None:
+            columns = dict((name, _column()) for name in COLUMNS)
+        self._columns = columns
+
+    def __len__(self):
+        return len(self._columns['time'])
+
+    def __getitem__(self, column):
+        '''Return the values of a column, e.g. series['temperature'].'''
+        return self._columns[column]
+
+    @property
+    def columns(self):
+        return tuple(name for name in COLUMNS if name in self._columns)
+
+    def between(self, start=None, end=None):
+        '''Return the readings observed from start up to, but excluding,
+        end.
+
+        Args:
+            start: aware datetime or seconds since the epoch; None for the
+                   first reading
+            end: as start; None for after the last reading
+        '''
+        times = self._columns['time']
+        low = 0 if start is None else \
+            bisect.bisect_left(times, timestamp(start))
+        high = len(times) if end is None else \
+            bisect.bisect_left(times, timestamp(end))
+        return Series(dict((name, values[low:high])
+                           for name, values in self._columns.items()))
+
+    def resample(self, interval, how='mean'):
+        '''Aggregate the readings into buckets of interval seconds.
+
+        Buckets start at multiples of interval since the epoch and only
+        buckets holding readings are returned.  Absent readings are
+        ignored; a column with none in a bucket is NaN there, or 0 when
+        counting.
+
+        Args:
+            interval: bucket width in seconds, e.g. 3600 for hourly
+            how: one of AGGREGATES
+
+        Returns:
+            Series whose time column holds the start of each bucket
+        '''
+        if how not in AGGREGATES:
+            raise ValueError('%s is not a valid aggregate.' % how)
+        aggregate = AGGREGATES[how]
+        names = [name for name in self.columns if name != 'time']
+        result = dict((name, _column()) for name in self.columns)
+
+        times = self._columns['time']
+        start = 0
+        while start < len(times):
+            bucket = math.floor(times[start] / interval) * interval
+            end = bisect.bisect_left(times, bucket + interval, start)
+            result['time'].append(bucket)
+            for name in names:
+                values = [value for value in self._columns[name][start:end]
+                          if not math.isnan(value)]
+                result[name].append(aggregate(values)
+                                    if values or how == 'count' else NAN)
+            start = end
+        return Series(result)
+
+
+class History(object):
+    '''Current Conditions readings of many cities in a local directory.
+
+    Thread-safe; a city's file is read on first query and kept in memory
+    until max_cities more recently queried cities push it out.  Appending
+    reads only the last record of a file that is not held.
+    '''
+
+    def __init__(self, path, max_cities=DEFAULT_MAX_CITIES):
+        '''
+        Args:
+            path: directory holding the files, created when missing
+            max_cities: number of cities kept in memory before the least
+                        recently used is dropped
+        '''
+        self.path = os.path.expanduser(path)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self.max_cities = max_cities
+        self._lock = threading.Lock()
+        self._series = OrderedDict()
+
+    def record(self, forecast):
+        '''Append the current observation of a Forecast.
+
+        Returns:
+            True when a new reading was stored
+        '''
+        return self.append(forecast.city_code, forecast.observation)
+
+    def append(self, city_code, observation):
+        '''Append a reading unless it is not newer than the last one stored.
+
+        The same reading is served until the next observation, so most
+        refreshes have nothing to add.
+
+        Args:
+            city_code: code for the location, e.g. on-82
+            observation: weathergc.observations.Observation, or None
+
+        Returns:
+            True when a new reading was stored
+        '''
+        if observation is None or observation.observed_at is None:
+            return False
+        row = [timestamp(observation.observed_at)]
+        for name in NUMERIC:
+            value = getattr(observation, name)
+            row.append(float(value) if value is not None else NAN)
+
+        city_code = city_code.lower()
+        with self._lock:
+            series = self._series.get(city_code)
+            if series is not None:
+                times = series['time']
+                last = times[-1] if times else None
+            else:
+                last = self._last_time(city_code)
+            if last is not None and row[0] <= last:
+                return False
+            with open(self._path(city_code), 'ab') as f:
+                f.write(RECORD.pack(*row))
+            if series is not None:
+                for name, value in zip(COLUMNS, row):
+                    series[name].append(value)
+        return True
+
+    def series(self, city_code, start=None, end=None):
+        '''Return a copy of the readings stored for a city, from start up
+        to, but excluding, end.
+
+        Args:
+            city_code: code for the location, e.g. on-82
+            start: aware datetime or seconds since the epoch; None for the
+                   first reading
+            end: as start; None for after the last reading
+        '''
+        with self._lock:
+            return self._load(city_code).between(start, end)
+
+    def cities(self):
+        '''Return the codes of the cities with readings, sorted.'''
+        return sorted(name[:-4] for name in os.listdir(self.path)
+                      if name.endswith('.obs'))
+
+    def memmap(self, city_code):
+        '''Map the file of a city read-only as a numpy structured array,
+        with one field per column.  Requires NumPy.'''
+        import numpy
+        dtype = numpy.dtype(DTYPE)
+        try:
+            count = os.path.getsize(self._path(city_code)) // dtype.itemsize
+        except OSError:
+            count = 0
+        if not count:
+            return numpy.zeros(0, dtype)
+        return numpy.memmap(self._path(city_code), dtype, mode='r',
+                            shape=(count,))
+
+    def _path(self, city_code):
+        return os.path.join(self.path, '%s.obs' % city_code.lower())
+
+    def _last_time(self, city_code):
+        '''Time of the last reading in the file of a city, or None.'''
+        try:
+            with open(self._path(city_code), 'r+b') as f:
+                complete = self._drop_torn(f)
+                if not complete:
+                    return None
+                f.seek(complete - RECORD.size)
+                return RECORD.unpack(f.read(RECORD.size))[0]
+        except (IOError, OSError):
+            return None
+
+    @staticmethod
+    def _drop_torn(f):
+        '''Drop a record torn by an interrupted write from the end of a
+        file opened for update.
+
+        Returns:
+            size of the complete records
+        '''
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        complete = size - size % RECORD.size
+        if complete != size:
+            f.truncate(complete)
+        return complete
+
+    def _load(self, city_code):
+        '''Return the in-memory Series of a city, reading its file when it
+        is not held.'''
+        city_code = city_code.lower()
+        series = self._series.get(city_code)
+        if series is not None:
+            self._series.move_to_end(city_code)
+            return series
+
+        try:
+            with open(self._path(city_code), 'r+b') as f:
+                complete = self._drop_torn(f)
+                f.seek(0)
+                data = f.read(complete)
+        except (IOError, OSError):
+            data = b''
+            complete = 0
+
+        values = _column()
+        values.frombytes(data[:complete])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        width = len(COLUMNS)
+        series = Series(dict((name, values[i::width])
+                             for i, name in enumerate(COLUMNS)))
+        self._series[city_code] = series
+        while len(self._series) > self.max_cities:
+            self._series.popitem(last=False)
+        return series
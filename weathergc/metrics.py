@@ -0,0 +1,219 @@
+'''Optional instrumentation of the fetch / parse / validate / collate /
+serialize pipeline.
+
+Nothing is recorded until a recorder is enabled; until then each
+instrumented point costs one global lookup.
+
+    from weathergc import metrics
+    m = metrics.enable(metrics.Metrics())
+    fetch_many(city_codes)
+    m.snapshot()
+    # {'stages': {'fetch': {'count': 768, 'sum': 41.2,
+    #                       'buckets': [(0.005, 0), ..., ('+Inf', 768)]},
+    #             'parse': {...}, 'validate': {...}, ...},
+    #  'bytes_downloaded': 7340032, 'responses': {200: 700, 304: 68},
+    #  'entries': {'Weather Forecasts': 9984, ...},
+    #  'schema_failures': {'on-999': 1}}
+
+Stages:
+    fetch      one HTTP request, from sending it to reading the body, less
+               the time a streaming parser spent on the body's chunks
+    parse      raw feed to sections (expat or xmltodict), including the
+               chunks parsed while the body downloads
+    validate   one section through its voluptuous schema
+    collate    all sections into the final structure
+    serialize  JSON encoding, indented document or compact fragment
+
+Any object with the methods of Metrics can be enabled instead, e.g. one
+that forwards straight to a Prometheus client.
+'''
+from __future__ import absolute_import
+import threading
+import time
+
+_clock = time.perf_counter
+
+# upper bounds in seconds, as Prometheus' default buckets
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5,
+                   5.0, 7.5, 10.0)
+
+# the enabled recorder, or None
+recorder = None
+
+
+class Histogram(object):
+    '''Distribution of observed durations.'''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        '''Return count, sum and cumulative (upper bound, count) buckets.'''
+        cumulative, total = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+
+class Metrics(object):
+    '''Thread-safe in-memory recorder.
+
+    Attributes:
+        stages: dict of stage name to Histogram of seconds
+        bytes_downloaded: response body bytes received
+        responses: dict of HTTP status to number of responses
+        entries: dict of section to number of entries parsed
+        schema_failures: dict of city code to feeds or sections rejected
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.bytes_downloaded = 0
+        self.responses = {}
+        self.entries = {}
+        self.schema_failures = {}
+
+    def observe(self, stage, seconds):
+        '''Record the duration of one run of a stage.'''
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def downloaded(self, status, nbytes):
+        '''Record a response and the size of its body.'''
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+            self.bytes_downloaded += nbytes
+
+    def parsed(self, city_code, source):
+        '''Record the entries of a freshly parsed feed.'''
+        with self._lock:
+            for section, entries in source.items():
+                if section != 'meta':
+                    self.entries[section] = \
+                        self.entries.get(section, 0) + len(entries)
+
+    def failed(self, city_code, stage):
+        '''Record a feed or section that did not pass validation.'''
+        with self._lock:
+            self.schema_failures[city_code] = \
+                self.schema_failures.get(city_code, 0) + 1
+
+    def snapshot(self):
+        '''Return a copy of everything recorded, see module documentation.'''
+        with self._lock:
+            return {
+                'stages': dict((name, histogram.snapshot())
+                               for name, histogram in self.stages.items()),
+                'bytes_downloaded': self.bytes_downloaded,
+                'responses': dict(self.responses),
+                'entries': dict(self.entries),
+                'schema_failures': dict(self.schema_failures),
+            }
+
+
+def enable(new_recorder):
+    '''Start recording into new_recorder, which is returned.'''
+    global recorder
+    recorder = new_recorder
+    return new_recorder
+
+
+def disable():
+    '''Stop recording.'''
+    global recorder
+    recorder = None
+
+
+class _Timer(object):
+    __slots__ = ('recorder', 'stage', 'start', 'excluded')
+
+    def __init__(self, recorder, stage):
+        self.recorder = recorder
+        self.stage = stage
+        self.excluded = 0.0
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.observe(self.stage,
+                              _clock() - self.start - self.excluded)
+
+    def exclude(self, seconds):
+        '''Leave seconds counted under another stage out of this one.'''
+        self.excluded += seconds
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def exclude(self, seconds):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage):
+    '''Context manager timing a stage; a shared no-op while disabled.
+
+    It returns a timer whose exclude(seconds) leaves time spent on a
+    nested stage out of this one.
+    '''
+    if recorder is None:
+        return _NULL_TIMER
+    return _Timer(recorder, stage)
+
+
+class TimedConsumer(object):
+    '''Streaming consumer, e.g. a weathergc.atom.AtomParser, that adds the
+    time spent in its feed() and close() to seconds.
+
+    ConnectionPool.request leaves those seconds out of the fetch stage, so
+    parsing that overlaps a download is counted as parse, not network.
+    '''
+    __slots__ = ('consumer', 'seconds')
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.seconds = 0.0
+
+    def feed(self, data):
+        start = _clock()
+        try:
+            self.consumer.feed(data)
+        finally:
+            self.seconds += _clock() - start
+
+    def close(self):
+        start = _clock()
+        try:
+            return self.consumer.close()
+        finally:
+            self.seconds += _clock() - start
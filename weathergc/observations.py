@@ -0,0 +1,140 @@
+'''Typed readings from the Current Conditions section.
+
+CC_SCHEMA leaves every reading as display text, e.g. "24.6 C" or
+"SW 28 km/h gust 46 km/h".  parse_observation turns one Current Conditions
+data dict into an Observation holding numbers and an aware datetime, using
+patterns compiled once at import.  Readings that are absent or cannot be
+understood are None.
+
+Units: temperatures in degrees C, pressure in kPa, speeds in km/h,
+visibility in km, humidity in percent.
+'''
+from __future__ import absolute_import
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, tzinfo
+
+NUMBER = r'(-?\d+(?:\.\d+)?)'
+
+_TEMPERATURE = re.compile(r'^%s\s*C$' % NUMBER)
+_PLAIN = re.compile(r'^%s$' % NUMBER)
+_PERCENT = re.compile(r'^%s\s*%%$' % NUMBER)
+_DISTANCE = re.compile(r'^%s\s*km$' % NUMBER)
+_PRESSURE = re.compile(r'^%s\s*kPa(?:\s+(\w+))?$' % NUMBER)
+_WIND = re.compile(r'^(?:([NSEW]{1,3}|VR)\s+)?%s\s*km/h'
+                   r'(?:\s+gust\s+%s\s*km/h)?$' % (NUMBER, NUMBER))
+_OBSERVED_AT = re.compile(
+    r'^(.*?)\s+(\d{1,2}):(\d{2})\s+(AM|PM)\s+([A-Z]{3})\s+\w+\s+'
+    r'(\d{1,2})\s+(\w+)\s+(\d{4})$')
+
+MONTHS = dict((name, number) for number, name in enumerate(
+    ('January', 'February', 'March', 'April', 'May', 'June', 'July',
+     'August', 'September', 'October', 'November', 'December'), 1))
+
+# hours from UTC of the zones used in weather.gc.ca observations
+UTC_OFFSETS = {'NST': -3.5, 'NDT': -2.5, 'AST': -4, 'ADT': -3,
+               'EST': -5, 'EDT': -4, 'CST': -6, 'CDT': -5,
+               'MST': -7, 'MDT': -6, 'PST': -8, 'PDT': -7,
+               'UTC': 0, 'GMT': 0}
+
+
+class FixedOffset(tzinfo):
+    '''Time zone at a fixed offset from UTC.'''
+
+    def __init__(self, name, hours):
+        self._name = name
+        self._offset = timedelta(hours=hours)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return self._name
+
+    def __repr__(self):
+        return 'FixedOffset(%r)' % self._name
+
+
+TIMEZONES = dict((name, FixedOffset(name, hours))
+                 for name, hours in UTC_OFFSETS.items())
+
+
+Observation = namedtuple('Observation', [
+    'station', 'observed_at', 'condition', 'temperature', 'dewpoint',
+    'humidity', 'humidex', 'wind_chill', 'pressure', 'tendency',
+    'wind_direction', 'wind_speed', 'wind_gust', 'visibility',
+    'air_quality'])
+
+
+def _number(pattern, value):
+    match = pattern.match(value.strip()) if value else None
+    return float(match.group(1)) if match else None
+
+
+def parse_observed_at(value):
+    '''Split "Kitchener 4:29 PM EDT Saturday 10 September 2016" into the
+    station name and an aware datetime.
+
+    Returns:
+        tuple of (station, datetime); both None when value is not understood
+    '''
+    match = _OBSERVED_AT.match(value.strip()) if value else None
+    if not match or match.group(5) not in TIMEZONES or \
+            match.group(7) not in MONTHS:
+        return None, None
+
+    station, hour, minute, ampm, zone, day, month, year = match.groups()
+    hour = int(hour) % 12 + (12 if ampm == 'PM' else 0)
+    return station, datetime(int(year), MONTHS[month], int(day), hour,
+                             int(minute), tzinfo=TIMEZONES[zone])
+
+
+def parse_observation(data):
+    '''Convert a Current Conditions data dict into an Observation.
+
+    Args:
+        data: dict as found under 'data' in a Current Conditions entry
+
+    Returns:
+        Observation
+    '''
+    station, observed_at = parse_observed_at(data.get('Observed at'))
+
+    pressure = tendency = None
+    match = _PRESSURE.match(
+        (data.get('Pressure / Tendency') or data.get('Pressure') or '')
+        .strip())
+    if match:
+        pressure, tendency = float(match.group(1)), match.group(2)
+
+    direction = speed = gust = None
+    wind = (data.get('Wind') or '').strip()
+    match = _WIND.match(wind)
+    if match:
+        direction = match.group(1)
+        speed = float(match.group(2))
+        gust = float(match.group(3)) if match.group(3) else None
+    elif wind.lower() == 'calm':
+        speed = 0.0
+
+    air_quality = _number(_PLAIN, data.get('Air Quality Health Index'))
+
+    return Observation(
+        station=station,
+        observed_at=observed_at,
+        condition=data.get('Condition') or None,
+        temperature=_number(_TEMPERATURE, data.get('Temperature')),
+        dewpoint=_number(_TEMPERATURE, data.get('Dewpoint')),
+        humidity=_number(_PERCENT, data.get('Humidity')),
+        humidex=_number(_PLAIN, data.get('Humidex')),
+        wind_chill=_number(_PLAIN, data.get('Wind Chill')),
+        pressure=pressure,
+        tendency=tendency,
+        wind_direction=direction,
+        wind_speed=speed,
+        wind_gust=gust,
+        visibility=_number(_DISTANCE, data.get('Visibility')),
+        air_quality=int(air_quality) if air_quality is not None else None)
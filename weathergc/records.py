@@ -0,0 +1,144 @@
+'''Compact, immutable record types for parsed forecasts.
+
+The dict based output of Forecast.as_dict repeats the same keys in every
+entry of every city.  These records are tuples with named fields and no
+per-instance __dict__, repeated strings such as timestamps are interned,
+and the Current Conditions readings share one key tuple between all the
+cities that report the same set of observations.
+
+    records = Forecast('on-82').as_records()
+    records.conditions[0].data['Temperature']
+    records.to_dict() == forecast.as_dict()
+'''
+from __future__ import absolute_import
+from collections import namedtuple
+from sys import intern
+
+# shared key tuples for Current Conditions data, see Conditions.create
+_keysets = {}
+
+
+def _intern(value):
+    return intern(value) if value is not None else None
+
+
+def _entry_fields(entry):
+    return (entry.get('title'), _intern(entry.get('published')),
+            _intern(entry.get('updated')))
+
+
+def _optional(items):
+    '''Dict of the items whose value is not None.'''
+    return dict((key, value) for key, value in items if value is not None)
+
+
+class Meta(namedtuple('Meta', ['lang', 'title', 'author_name', 'author_uri',
+                               'updated', 'logo', 'rights', 'badge'])):
+    '''Feed level information.'''
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, meta):
+        author = meta.get('author')
+        return cls(_intern(meta.get('lang')), meta.get('title'),
+                   _intern(author.get('name')) if author else None,
+                   _intern(author.get('uri')) if author else None,
+                   meta.get('updated'), _intern(meta.get('logo')),
+                   _intern(meta.get('rights')), meta.get('badge'))
+
+    def to_dict(self):
+        meta = _optional((field, getattr(self, field)) for field in
+                         ('lang', 'title', 'updated', 'logo', 'rights',
+                          'badge'))
+        author = _optional((('name', self.author_name),
+                            ('uri', self.author_uri)))
+        if author:
+            meta['author'] = author
+        return meta
+
+
+class _Entry(object):
+    '''Behaviour shared by the entry records.'''
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, entry):
+        return cls(entry.get('summary'), *_entry_fields(entry))
+
+    def to_dict(self):
+        return _optional(zip(self._fields, self))
+
+
+class Alert(_Entry, namedtuple('Alert', ['summary', 'title', 'published',
+                                         'updated'])):
+    '''A Warnings and Watches entry.'''
+    __slots__ = ()
+
+
+class Period(_Entry, namedtuple('Period', ['summary', 'title', 'published',
+                                           'updated'])):
+    '''A Weather Forecasts entry, one per forecast period.'''
+    __slots__ = ()
+
+
+class Conditions(namedtuple('Conditions', ['keys', 'values', 'title',
+                                           'published', 'updated'])):
+    '''A Current Conditions entry.
+
+    The observations are held as a key tuple shared between records with
+    the same set of observations and a tuple of values; `data` rebuilds
+    the dict.  Both are None for an entry without a summary.
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, entry):
+        data = entry.get('data')
+        if data is None:
+            return cls(None, None, *_entry_fields(entry))
+
+        keys = tuple(data)
+        keys = _keysets.setdefault(keys, tuple(intern(key) for key in keys))
+        return cls(keys, tuple(data[key] for key in keys),
+                   *_entry_fields(entry))
+
+    @property
+    def data(self):
+        if self.keys is None:
+            return None
+        return dict(zip(self.keys, self.values))
+
+    def to_dict(self):
+        entry = _optional((('title', self.title),
+                           ('published', self.published),
+                           ('updated', self.updated)))
+        if self.keys is not None:
+            entry['data'] = self.data
+        return entry
+
+
+class ForecastRecord(namedtuple('ForecastRecord', ['meta', 'warnings',
+                                                   'conditions',
+                                                   'forecasts'])):
+    '''All sections of one city's forecast.'''
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, collated):
+        '''Build from the structure returned by Forecast.as_dict.'''
+        return cls(Meta.create(collated['meta']),
+                   tuple(Alert.create(entry) for entry in
+                         collated.get('Warnings and Watches', ())),
+                   tuple(Conditions.create(entry) for entry in
+                         collated.get('Current Conditions', ())),
+                   tuple(Period.create(entry) for entry in
+                         collated.get('Weather Forecasts', ())))
+
+    def to_dict(self):
+        '''Return the structure of Forecast.as_dict.'''
+        return {
+            'meta': self.meta.to_dict(),
+            'Warnings and Watches': [e.to_dict() for e in self.warnings],
+            'Current Conditions': [e.to_dict() for e in self.conditions],
+            'Weather Forecasts': [e.to_dict() for e in self.forecasts],
+        }
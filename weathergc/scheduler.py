@@ -0,0 +1,255 @@
+'''Long running poller that keeps many cities fresh with few requests.
+
+Every city is polled on its own interval instead of one fixed period:
+
+* while warnings or watches are in effect, every `warning_interval`
+  seconds;
+* otherwise just after its next update is expected, judging by the
+  average time between the feed's past <updated> stamps;
+* when an expected update has not appeared, or the request failed, with
+  exponential back-off from `min_interval` up to `max_interval`.
+
+Requests are conditional (see Forecast.refresh), so a poll that finds the
+feed unchanged costs a 304, and at most `max_workers` are in flight.  run()
+hands each city to the workers as it comes due and reschedules it as soon
+as its poll completes, so a slow request only holds up its own city.
+
+    poller = Poller(['on-82', 'ns-19'], on_refresh=handle)
+    poller.run()    # until poller.stop() is called from another thread
+'''
+from __future__ import absolute_import
+import heapq
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from queue import Empty, Queue
+
+from weathergc.alerts import in_effect, timestamp
+from weathergc.batch import DEFAULT_WORKERS
+from weathergc.forecast import Forecast
+
+MIN_INTERVAL = 60
+MAX_INTERVAL = 3600
+WARNING_INTERVAL = 120
+# seconds after the expected update before it is polled for
+SLACK = 60
+# weight of the latest gap between updates in the cadence average
+CADENCE_WEIGHT = 0.3
+
+
+def warnings_in_effect(forecast):
+    '''True when the forecast lists a warning, watch or statement that has
+    not ended.'''
+    return any(in_effect(alert) for alert in forecast.warnings)
+
+
+class CityState(object):
+    '''Polling state of one city.
+
+    Attributes:
+        city_code: code for the location
+        forecast: the city's Forecast, loaded on its first poll; None when
+                  the city code is invalid
+        due: time of the next poll, None when the city is never polled
+        interval: seconds between the last poll and the next
+        cadence: average seconds between feed updates, None until two
+                 updates have been seen
+        updated_at: time of the newest feed <updated> stamp seen
+        misses: polls in a row that found no new update or failed
+        warnings: True when warnings were in effect at the last poll
+        error: exception raised by the last poll, or by Forecast for an
+               invalid city code, or None
+        polls: number of polls so far
+    '''
+
+    def __init__(self, city_code, forecast, due):
+        self.city_code = city_code
+        self.forecast = forecast
+        self.due = due
+        self.interval = None
+        self.cadence = None
+        self.updated_at = None
+        self.misses = 0
+        self.warnings = False
+        self.error = None
+        self.polls = 0
+
+
+class Poller(object):
+    '''Poll many cities, each on an interval adapted to its feed.'''
+
+    def __init__(self, city_codes, max_workers=DEFAULT_WORKERS,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 warning_interval=WARNING_INTERVAL, on_refresh=None,
+                 cache=None):
+        '''
+        An invalid city code does not stop the others from being polled:
+        its CityState records the ValueError and it is never polled.
+
+        Args:
+            city_codes: iterable of city codes, e.g. ['on-82', 'ns-19']
+            max_workers: number of concurrent requests
+            min_interval: shortest seconds between polls without warnings
+            max_interval: longest seconds between polls
+            warning_interval: seconds between polls while warnings are
+                              in effect
+            on_refresh: called as on_refresh(forecast, changed, error)
+                        after every poll, from the polling thread
+            cache: feed cache passed to every Forecast
+        '''
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.warning_interval = warning_interval
+        self.on_refresh = on_refresh
+
+        now = time.time()
+        self.cities = {}
+        self._queue = []
+        for city_code in city_codes:
+            try:
+                forecast = Forecast(city_code, lazy=True, cache=cache)
+            except ValueError as e:
+                state = self.cities[city_code] = CityState(city_code, None,
+                                                           None)
+                state.error = e
+                continue
+            self.cities[city_code] = CityState(city_code, forecast, now)
+            self._queue.append((now, city_code))
+        heapq.heapify(self._queue)
+        # (state, changed, error) of finished polls; None wakes run()
+        self._results = Queue()
+        self._stopped = threading.Event()
+        self._workers = None
+
+    def next_due(self):
+        '''Return the time the next city is due.'''
+        if not self._queue:
+            return time.time() + self.max_interval
+        return self._queue[0][0]
+
+    def poll_once(self, now=None):
+        '''Poll every city that is due, wait for the polls to complete and
+        schedule the next poll of each.
+
+        Returns:
+            number of cities polled
+        '''
+        due = self._submit(time.time() if now is None else now)
+        finished = 0
+        while finished < due:
+            result = self._results.get()
+            if result is not None:
+                self._finish(*result)
+                finished += 1
+        return due
+
+    def run(self):
+        '''Poll until stop() is called.'''
+        try:
+            while not self._stopped.is_set():
+                self._submit(time.time())
+                try:
+                    result = self._results.get(
+                        timeout=max(0, self.next_due() - time.time()))
+                except Empty:
+                    continue
+                while result is not None:
+                    self._finish(*result)
+                    try:
+                        result = self._results.get_nowait()
+                    except Empty:
+                        result = None
+        finally:
+            self.close()
+
+    def stop(self):
+        '''Make run() return without waiting for the polls in flight.'''
+        self._stopped.set()
+        self._results.put(None)
+
+    def close(self):
+        '''Shut down the worker threads.'''
+        if self._workers is not None:
+            self._workers.terminate()
+            self._workers = None
+
+    def next_interval(self, state, now):
+        '''Return the seconds to wait before polling a city again.'''
+        if state.error is None and state.warnings:
+            return self.warning_interval
+        if state.error is None and state.misses == 0 and \
+                state.cadence is not None:
+            interval = state.updated_at + state.cadence + SLACK - now
+            if interval >= self.min_interval:
+                return min(interval, self.max_interval)
+        return min(self.min_interval * 2 ** state.misses, self.max_interval)
+
+    def _submit(self, now):
+        '''Hand the cities due by now to the workers.
+
+        Returns:
+            number of cities handed over
+        '''
+        due = 0
+        while self._queue and self._queue[0][0] <= now:
+            state = self.cities[heapq.heappop(self._queue)[1]]
+            if self._workers is None:
+                self._workers = ThreadPool(self.max_workers)
+            self._workers.apply_async(self._poll, (state,),
+                                      callback=self._results.put)
+            due += 1
+        return due
+
+    @staticmethod
+    def _poll(state):
+        try:
+            return state, state.forecast.refresh(), None
+        except Exception as e:
+            return state, False, e
+
+    def _finish(self, state, changed, error):
+        error = self._schedule(state, changed, error, time.time())
+        if self.on_refresh is not None:
+            self.on_refresh(state.forecast, changed, error)
+
+    def _schedule(self, state, changed, error, now):
+        '''Record the outcome of a poll and queue the next one.
+
+        Returns:
+            the error of the poll, including one raised while reading the
+            refreshed forecast
+        '''
+        state.polls += 1
+        if error is None:
+            try:
+                self._observe(state, changed)
+                state.warnings = warnings_in_effect(state.forecast)
+            except Exception as e:
+                error = e
+        state.error = error
+        if error is not None:
+            state.misses += 1
+
+        state.interval = self.next_interval(state, now)
+        state.due = now + state.interval
+        heapq.heappush(self._queue, (state.due, state.city_code))
+        return error
+
+    @staticmethod
+    def _observe(state, changed):
+        '''Update the cadence estimate from the feed's <updated> stamp.'''
+        stamp = timestamp(state.forecast.updated) if changed else None
+        if stamp is None or (state.updated_at is not None and
+                             stamp <= state.updated_at):
+            state.misses += 1
+            return
+
+        if state.updated_at is not None:
+            gap = stamp - state.updated_at
+            if state.cadence is None:
+                state.cadence = gap
+            else:
+                state.cadence += (gap - state.cadence) * CADENCE_WEIGHT
+        state.updated_at = stamp
+        state.misses = 0
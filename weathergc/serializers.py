@@ -0,0 +1,94 @@
+'''Compact JSON encoding and stitching of pre-encoded fragments.
+
+Forecast.as_json(compact=True) and Forecast.json_fragment encode with
+`dumps`, which uses orjson when it is installed and otherwise produces
+exactly the output of json.dumps(obj, separators=(',', ':')).  orjson
+writes non-ASCII characters as UTF-8 instead of \\u escapes, so its output
+parses to the same data but is not byte-identical.  Another encoder can be
+plugged in with set_encoder.
+
+Fragments are complete JSON values, so a response for many cities can be
+assembled from them without decoding or encoding anything again:
+
+    join_forecasts([Forecast('on-82'), Forecast('ns-19')])
+    # '{"on-82":{"meta":...},"ns-19":{...}}'
+'''
+from __future__ import absolute_import
+import json
+
+SEPARATORS = (',', ':')
+
+
+def json_dumps(obj):
+    '''Compact encoding with the standard library.'''
+    return json.dumps(obj, separators=SEPARATORS)
+
+
+def orjson_dumps(obj):
+    '''Compact encoding with orjson.'''
+    import orjson
+    return orjson.dumps(obj).decode('utf-8')
+
+
+def _default_encoder():
+    try:
+        import orjson  # noqa
+    except ImportError:
+        return json_dumps
+    return orjson_dumps
+
+
+# chosen on first use, so orjson is not imported with weathergc
+_encoder = None
+
+
+def set_encoder(encoder):
+    '''Use encoder(obj) -> str for compact JSON; None restores json_dumps.
+
+    Fragments already encoded by a Forecast are kept until its next
+    refresh.
+    '''
+    global _encoder
+    _encoder = encoder if encoder is not None else json_dumps
+
+
+def dumps(obj):
+    '''Encode obj as compact JSON with the current encoder.'''
+    global _encoder
+    if _encoder is None:
+        _encoder = _default_encoder()
+    return _encoder(obj)
+
+
+def join_object(items):
+    '''Stitch (key, fragment) pairs into a JSON object.
+
+    Args:
+        items: iterable of (str key, JSON text of the value)
+
+    Returns:
+        JSON text of the object, identical to json_dumps of the decoded
+        values when the fragments came from json_dumps
+    '''
+    return '{%s}' % ','.join('%s:%s' % (json_dumps(key), fragment)
+                             for key, fragment in items)
+
+
+def join_forecasts(forecasts, sections=None):
+    '''Stitch many forecasts into one JSON object keyed by city code.
+
+    Args:
+        forecasts: iterable of Forecast
+        sections: names of the sections to include, e.g. ['meta',
+                  'Current Conditions']; all when None
+
+    Returns:
+        JSON text
+    '''
+    if sections is None:
+        return join_object((f.city_code, f.as_json(compact=True))
+                           for f in forecasts)
+    return join_object(
+        (f.city_code, join_object((section, f.json_fragment(section))
+                                  for section in sections))
+        for f in forecasts)
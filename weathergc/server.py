@@ -0,0 +1,343 @@
+'''HTTP server answering from pre-encoded forecasts.
+
+    GET /city/<city-code>   one forecast, as Forecast.as_json(compact=True)
+    GET /province/<pp>      {city code: forecast} of a province, e.g. on
+    GET /warnings           {city code: Warnings and Watches} for every city
+                            with warnings in effect
+
+A ForecastStore keeps each response as encoded bytes with an ETag.  It
+re-encodes a city only when its feed changes, and rebuilds a province or
+warnings response from the stored fragments on the first request after one
+of its cities changes.  A request is therefore a dictionary lookup and a
+socket write.  If-None-Match is answered with 304 Not Modified, and a
+city the poller has not fetched yet, or a province none of whose cities it
+has, with 503 Service Unavailable.  A scheduler.Poller keeps the store
+fresh from a background thread:
+
+    serve(city_codes('ON'), port=8080)
+
+Only the standard library is used.
+'''
+import asyncio
+import hashlib
+import sys
+import threading
+from collections import namedtuple
+
+from weathergc.cities import PROVINCES
+from weathergc.scheduler import Poller, warnings_in_effect
+from weathergc.serializers import join_object
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+# longest request line or header line accepted
+MAX_LINE = 8192
+# seconds a client is asked to wait for a city that has not been polled
+RETRY_AFTER = 10
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request',
+           404: 'Not Found', 405: 'Method Not Allowed',
+           503: 'Service Unavailable'}
+
+# body is the encoded response, etag its quoted ETag header value
+Resource = namedtuple('Resource', ['body', 'etag'])
+
+
+def encode(text):
+    '''Return a Resource for JSON text.'''
+    body = text.encode('utf-8')
+    return Resource(body, '"%s"' % hashlib.sha1(body).hexdigest()[:20])
+
+
+class ForecastStore(object):
+    '''Thread-safe, pre-encoded responses for many cities.'''
+
+    def __init__(self, city_codes=()):
+        '''
+        Args:
+            city_codes: codes of the cities that will be updated, which
+                        are pending until their first update
+        '''
+        self._expected = set(city_code.lower() for city_code in city_codes)
+        self._lock = threading.Lock()
+        self._cities = {}
+        self._fragments = {}
+        self._warnings = {}
+        # province and warnings responses, dropped as their cities change
+        self._derived = {}
+
+    def __len__(self):
+        return len(self._cities)
+
+    def update(self, forecast):
+        '''Encode the current data of a Forecast.'''
+        city_code = forecast.city_code
+        text = forecast.as_json(compact=True)
+        warnings = forecast.json_fragment('Warnings and Watches') \
+            if warnings_in_effect(forecast) else None
+        resource = encode(text)
+
+        with self._lock:
+            self._fragments[city_code] = text
+            self._cities[city_code] = resource
+            if warnings is not None:
+                self._warnings[city_code] = warnings
+            else:
+                self._warnings.pop(city_code, None)
+            self._derived.pop(city_code.split('-')[0], None)
+            self._derived.pop('warnings', None)
+
+    def on_refresh(self, forecast, changed, error):
+        '''scheduler.Poller on_refresh callback, encoding a city whenever
+        its feed changed.
+
+        Errors are reported on stderr and the city keeps its previous
+        response, so one bad feed does not stop the poller.
+        '''
+        if error is None and changed:
+            try:
+                self.update(forecast)
+            except Exception as e:
+                error = e
+        if error is not None:
+            print('%s: %s' % (forecast.city_code, error), file=sys.stderr)
+
+    def city(self, city_code):
+        '''Return the Resource of a city, or None when it is not held.'''
+        return self._cities.get(city_code.lower())
+
+    def province(self, province):
+        '''Return the Resource of a province, or None when unknown.'''
+        province = province.lower()
+        if province.upper() not in PROVINCES:
+            return None
+        with self._lock:
+            resource = self._derived.get(province)
+            if resource is None:
+                prefix = province + '-'
+                resource = self._derived[province] = encode(join_object(
+                    (city_code, self._fragments[city_code])
+                    for city_code in sorted(self._fragments)
+                    if city_code.startswith(prefix)))
+            return resource
+
+    def warnings(self):
+        '''Return the Resource listing the cities with warnings.'''
+        with self._lock:
+            resource = self._derived.get('warnings')
+            if resource is None:
+                resource = self._derived['warnings'] = encode(join_object(
+                    sorted(self._warnings.items())))
+            return resource
+
+    def resolve(self, path):
+        '''Return the Resource for a request path, or None.'''
+        parts = _parts(path)
+        if len(parts) == 2 and parts[0] == 'city':
+            return self.city(parts[1])
+        if len(parts) == 2 and parts[0] == 'province':
+            return self.province(parts[1])
+        if parts == ['warnings']:
+            return self.warnings()
+        return None
+
+    def pending(self, path):
+        '''True for the path of an expected city that has no data yet, or
+        of a province none of whose expected cities has.'''
+        parts = _parts(path)
+        if len(parts) != 2:
+            return False
+        with self._lock:
+            if parts[0] == 'city':
+                city_code = parts[1].lower()
+                return city_code in self._expected and \
+                    city_code not in self._cities
+            if parts[0] == 'province':
+                prefix = parts[1].lower() + '-'
+                return any(city_code.startswith(prefix)
+                           for city_code in self._expected) and \
+                    not any(city_code.startswith(prefix)
+                            for city_code in self._cities)
+        return False
+
+
+def _parts(path):
+    return path.split('?', 1)[0].strip('/').split('/')
+
+
+def respond(store, method, path, headers):
+    '''Build the response to one request.
+
+    Args:
+        store: ForecastStore
+        method: request method, e.g. GET
+        path: request target, e.g. /city/on-82
+        headers: dict of request headers, keyed by lowercase name
+
+    Returns:
+        tuple of (status, list of (header, value), body bytes); the body
+        is not sent in reply to HEAD
+    '''
+    if method not in ('GET', 'HEAD'):
+        return 405, [('Allow', 'GET, HEAD')], b''
+    if store.pending(path):
+        return 503, [('Retry-After', str(RETRY_AFTER))], b''
+    resource = store.resolve(path)
+    if resource is None:
+        return 404, [], b''
+
+    response_headers = [('ETag', resource.etag),
+                        ('Cache-Control', 'no-cache')]
+    if resource.etag in _etags(headers.get('if-none-match')):
+        return 304, response_headers, b''
+    response_headers.append(('Content-Type', 'application/json'))
+    return 200, response_headers, resource.body
+
+
+def _etags(value):
+    if not value:
+        return ()
+    return [etag.strip() for etag in value.split(',')]
+
+
+async def _read_request(reader):
+    '''Read a request line and headers.
+
+    Returns:
+        tuple of (method, path, version, headers), or None at end of stream
+    '''
+    line = await reader.readline()
+    if not line:
+        return None
+    method, path, version = line.decode('latin-1').split()
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    return method, path, version, headers
+
+
+async def _discard_body(reader, headers):
+    '''Skip the body of a request, which no resource accepts.
+
+    Returns:
+        False when the body could not be skipped and the connection has
+        to be closed after the response
+
+    Raises:
+        ValueError: the Content-Length is not a number
+    '''
+    if 'transfer-encoding' in headers:
+        return False
+    remaining = int(headers.get('content-length', 0))
+    if remaining < 0:
+        raise ValueError('negative Content-Length')
+    while remaining:
+        remaining -= len(await reader.readexactly(min(remaining, 65536)))
+    return True
+
+
+def _keep_alive(version, headers):
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.1':
+        return connection != 'close'
+    return connection == 'keep-alive'
+
+
+class Server(object):
+    '''asyncio HTTP/1.1 server for a ForecastStore, with keep-alive.'''
+
+    def __init__(self, store, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.store = store
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        '''Start listening; port 0 picks a free port, see self.port.'''
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=MAX_LINE)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except (ValueError, asyncio.LimitOverrunError):
+                    self._write(writer, 400, [], b'', False)
+                    break
+                if request is None:
+                    break
+                method, path, version, headers = request
+                try:
+                    discarded = await _discard_body(reader, headers)
+                except ValueError:
+                    self._write(writer, 400, [], b'', False)
+                    break
+                keep_alive = discarded and _keep_alive(version, headers)
+                status, response_headers, body = respond(
+                    self.store, method, path, headers)
+                self._write(writer, status, response_headers, body,
+                            keep_alive, method != 'HEAD')
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write(writer, status, headers, body, keep_alive, send_body=True):
+        lines = ['HTTP/1.1 %d %s' % (status, REASONS[status])]
+        lines.extend('%s: %s' % header for header in headers)
+        if status != 304:
+            lines.append('Content-Length: %d' % len(body))
+        if not keep_alive:
+            lines.append('Connection: close')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') +
+                     (body if send_body else b''))
+
+
+def serve(city_codes, host=DEFAULT_HOST, port=DEFAULT_PORT, **poller_args):
+    '''Poll cities in the background and serve them until interrupted.
+
+    Invalid city codes are reported on stderr and not served.
+
+    Args:
+        city_codes: iterable of city codes
+        host: address to listen on
+        port: port to listen on
+        poller_args: passed on to scheduler.Poller, e.g. max_workers
+    '''
+    poller = Poller(city_codes, **poller_args)
+    valid = []
+    for state in poller.cities.values():
+        if state.forecast is None:
+            print('%s: %s' % (state.city_code, state.error), file=sys.stderr)
+        else:
+            valid.append(state.city_code)
+    store = ForecastStore(valid)
+    poller.on_refresh = store.on_refresh
+    thread = threading.Thread(target=poller.run, name='weathergc-poller')
+    thread.daemon = True
+    thread.start()
+    try:
+        asyncio.run(Server(store, host, port).serve_forever())
+    finally:
+        poller.stop()
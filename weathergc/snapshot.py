@@ -0,0 +1,199 @@
+'''Current readings of many cities packed into NumPy arrays.
+
+A Snapshot holds one array per reading (the numeric fields of
+weathergc.observations.Observation, NaN where absent), the observation
+time in seconds since the epoch, and whether each city has a warning in
+effect.  Province-wide questions are then a few array operations instead
+of a walk over every forecast:
+
+    s = Snapshot.from_forecasts(fetch_many(city_codes()).forecasts.values())
+    s.province('ON').top('temperature', 5).codes   # warmest in Ontario
+    s.top('temperature', 5, largest=False)         # coldest anywhere
+    s.filter(s['wind_gust'] > 70).codes
+    s.group_by_province('wind_speed', 'max')       # {'ON': 52.0, ...}
+    s.count_by_province(s['warnings'])             # {'ON': 12, ...}
+
+Requires NumPy.
+'''
+from __future__ import absolute_import
+import numpy
+
+from weathergc.history import NUMERIC, timestamp
+from weathergc.scheduler import warnings_in_effect
+
+COLUMNS = NUMERIC + ('observed_at', 'warnings')
+
+# per province aggregates, each ignoring NaN
+GROUP_AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+
+class Snapshot(object):
+    '''Readings of many cities, one array per column, in city order.
+
+    Attributes:
+        codes: array of city codes
+        provinces: array of province abbreviations, e.g. 'ON'
+    '''
+
+    def __init__(self, codes, columns):
+        '''
+        Args:
+            codes: sequence of city codes
+            columns: dict of every name in COLUMNS to an array as long as
+                     codes
+        '''
+        self.codes = numpy.asarray(codes, dtype=object)
+        self.provinces = numpy.array(
+            [code.split('-')[0].upper() for code in self.codes], dtype=object)
+        self._columns = columns
+        self._positions = None
+        self._groups = None
+
+    @classmethod
+    def from_forecasts(cls, forecasts):
+        '''Pack the current observation of each Forecast.'''
+        forecasts = list(forecasts)
+        count = len(forecasts)
+        columns = dict((name, numpy.full(count, numpy.nan))
+                       for name in NUMERIC + ('observed_at',))
+        columns['warnings'] = numpy.zeros(count, dtype=bool)
+
+        for i, forecast in enumerate(forecasts):
+            observation = forecast.observation
+            if observation is not None:
+                for name in NUMERIC:
+                    value = getattr(observation, name)
+                    if value is not None:
+                        columns[name][i] = value
+                if observation.observed_at is not None:
+                    columns['observed_at'][i] = \
+                        timestamp(observation.observed_at)
+            columns['warnings'][i] = warnings_in_effect(forecast)
+        return cls([forecast.city_code for forecast in forecasts], columns)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, column):
+        '''Return the array of a column, e.g. s['temperature'].'''
+        return self._columns[column]
+
+    def __contains__(self, city_code):
+        return city_code.lower() in self._index()
+
+    def get(self, city_code):
+        '''Return {column: value} for one city; None for absent readings.
+
+        Raises:
+            KeyError: the city is not in the snapshot
+        '''
+        return self._row(self._index()[city_code.lower()])
+
+    def take(self, indices):
+        '''Return a Snapshot of the cities at indices, in that order.
+
+        Args:
+            indices: integer array, or boolean array as long as the
+                     snapshot
+        '''
+        return Snapshot(self.codes[indices],
+                        dict((name, values[indices])
+                             for name, values in self._columns.items()))
+
+    def filter(self, mask):
+        '''Return the cities where mask is True, e.g.
+        s.filter(s['temperature'] < 0).'''
+        return self.take(numpy.asarray(mask, dtype=bool))
+
+    def province(self, province):
+        '''Return the cities of a province or territory, e.g. 'ON'.'''
+        return self.filter(self.provinces == province.upper())
+
+    def sort(self, column, descending=False):
+        '''Return the cities ordered by a column; absent readings last.'''
+        values = self._columns[column].astype(float)
+        order = numpy.argsort(-values if descending else values,
+                              kind='stable')
+        return self.take(order)
+
+    def top(self, column, k, largest=True):
+        '''Return the k cities with the largest (or smallest) readings,
+        best first.  Cities without the reading are left out.'''
+        values = self._columns[column].astype(float)
+        present = numpy.flatnonzero(~numpy.isnan(values))
+        keys = -values[present] if largest else values[present]
+        if k < len(present):
+            nearest = numpy.argpartition(keys, k)[:k]
+            present, keys = present[nearest], keys[nearest]
+        return self.take(present[numpy.argsort(keys, kind='stable')])
+
+    def group_by_province(self, column, how='mean'):
+        '''Aggregate a column per province, ignoring absent readings.
+
+        Args:
+            column: name in COLUMNS
+            how: one of GROUP_AGGREGATES
+
+        Returns:
+            dict of province to value; NaN where a province has no reading
+            (0 when counting)
+        '''
+        if how not in GROUP_AGGREGATES:
+            raise ValueError('%s is not a valid aggregate.' % how)
+        names, groups = self._province_groups()
+        values = self._columns[column].astype(float)
+        present = ~numpy.isnan(values)
+        counts = numpy.bincount(groups, weights=present,
+                                minlength=len(names))
+        if how == 'count':
+            result = counts.astype(int)
+        elif how in ('sum', 'mean'):
+            sums = numpy.bincount(groups, weights=numpy.where(present,
+                                                              values, 0),
+                                  minlength=len(names))
+            if how == 'sum':
+                result = sums
+            else:
+                with numpy.errstate(invalid='ignore', divide='ignore'):
+                    result = sums / counts
+        else:
+            reduce = numpy.fmin if how == 'min' else numpy.fmax
+            result = numpy.full(len(names), numpy.nan)
+            reduce.at(result, groups, values)
+        return dict(zip(names, result.tolist()))
+
+    def count_by_province(self, mask=None):
+        '''Number of cities per province, of those where mask is True when
+        given, e.g. s.count_by_province(s['warnings']).'''
+        names, groups = self._province_groups()
+        if mask is not None:
+            groups = groups[numpy.asarray(mask, dtype=bool)]
+        counts = numpy.bincount(groups, minlength=len(names))
+        return dict(zip(names, counts.tolist()))
+
+    def to_dict(self):
+        '''Return {city code: {column: value}}, e.g. for JSON output.'''
+        return dict((code, self._row(i)) for i, code in enumerate(self.codes))
+
+    def _row(self, i):
+        row = {}
+        for name in COLUMNS:
+            value = self._columns[name][i].item()
+            if isinstance(value, float) and value != value:
+                value = None
+            row[name] = value
+        return row
+
+    def _index(self):
+        if self._positions is None:
+            self._positions = dict((code, i)
+                                   for i, code in enumerate(self.codes))
+        return self._positions
+
+    def _province_groups(self):
+        '''Sorted province names, and the group number of every city.'''
+        if self._groups is None:
+            names, groups = numpy.unique(self.provinces.astype(str),
+                                         return_inverse=True)
+            self._groups = (names.tolist(), groups.ravel())
+        return self._groups
@@ -0,0 +1,194 @@
+'''Benchmark the forecast pipeline over the bundled feed corpus.
+
+Every file in tests/data is pushed through each stage of the pipeline and
+the stage is timed (best of --repeat runs) and then run once more under
+tracemalloc to record its peak memory.  Stages:
+
+    parse      raw xml -> python objects
+    validate   xmltodict output -> sections (Forecast._parse); the expat
+               engine validates while parsing, so it reports no timing here
+    collate    sections -> final structure (Forecast._collate)
+    serialize  final structure -> JSON (json.dumps with indent=4)
+
+Results are written as JSON with a fixed layout so runs can be compared
+across commits and engines:
+
+    python -m weathergc.tests.benchmark --output new.json --compare old.json
+'''
+from __future__ import absolute_import, division, print_function
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+import xmltodict
+
+from weathergc.atom import parse_feed
+from weathergc.forecast import ENGINES, Forecast
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+clock = time.perf_counter
+
+FORMAT_VERSION = 1
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+STAGES = ('parse', 'validate', 'collate', 'serialize')
+
+
+def load_corpus(folder=DATA_DIR):
+    '''Return list of (city_code, xml bytes) for every feed in folder.'''
+    corpus = []
+    for name in sorted(os.listdir(folder)):
+        if name.endswith('.xml'):
+            with open(os.path.join(folder, name), 'rb') as f:
+                corpus.append((name[:-4], f.read()))
+    return corpus
+
+
+def _collate(forecast, source):
+    forecast._source = source
+    # the same source is collated on every run; drop the sections memoized
+    # by the last one so each run does the whole work
+    forecast._memo_source = None
+    return forecast._collate()
+
+
+def pipeline(engine):
+    '''Return list of (stage, func) where func(forecast, previous) returns
+    the input of the next stage.  A func of None means the stage is folded
+    into another one for this engine.'''
+    if engine == 'xmltodict':
+        parse = lambda f, xml: xmltodict.parse(xml, dict_constructor=dict)
+        validate = lambda f, obj: f._parse(obj)
+    else:
+        parse = lambda f, xml: parse_feed(xml)
+        validate = None
+    serialize = lambda f, collated: json.dumps(collated, indent=4)
+    return list(zip(STAGES, (parse, validate, _collate, serialize)))
+
+
+def _run(func, forecasts, inputs):
+    return [func(f, value) for f, value in zip(forecasts, inputs)]
+
+
+def _time(func, forecasts, inputs, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = clock()
+        outputs = _run(func, forecasts, inputs)
+        elapsed = clock() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, outputs
+
+
+def _peak_memory(func, forecasts, inputs):
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _run(func, forecasts, inputs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(engine, corpus, repeat=3):
+    '''Benchmark one parser engine.
+
+    Returns:
+        dict of stage name to measurements; measurements are None for
+        stages the engine does not have
+    '''
+    forecasts = [Forecast(city_code, xml=xml, engine=engine)
+                 for city_code, xml in corpus]
+    total_bytes = sum(len(xml) for _, xml in corpus)
+
+    results = {}
+    values = [xml for _, xml in corpus]
+    for stage, func in pipeline(engine):
+        if func is None:
+            results[stage] = None
+            continue
+        seconds, outputs = _time(func, forecasts, values, repeat)
+        peak = _peak_memory(func, forecasts, values)
+        results[stage] = {
+            'seconds': round(seconds, 6),
+            'files_per_second': round(len(corpus) / seconds, 1),
+            'input_mb_per_second': round(
+                total_bytes / seconds / 1e6, 3),
+            'peak_memory_kib': None if peak is None else peak // 1024,
+        }
+        values = outputs
+    return results
+
+
+def run(engines, repeat=3, folder=DATA_DIR):
+    '''Benchmark engines over the corpus in folder.
+
+    Returns:
+        dict in the stable results format
+    '''
+    corpus = load_corpus(folder)
+    return {
+        'format': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'files': len(corpus),
+        'bytes': sum(len(xml) for _, xml in corpus),
+        'repeat': repeat,
+        'engines': dict((engine, benchmark(engine, corpus, repeat))
+                        for engine in engines),
+    }
+
+
+def compare(old, new):
+    '''Return lines describing the speedup of new over old per stage.'''
+    lines = []
+    for engine in sorted(new['engines']):
+        for stage in STAGES:
+            before = old['engines'].get(engine, {}).get(stage)
+            after = new['engines'][engine][stage]
+            if before and after:
+                lines.append('%-10s %-10s %8.3fs -> %8.3fs  x%.2f' % (
+                    engine, stage, before['seconds'], after['seconds'],
+                    before['seconds'] / after['seconds']))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--engine', action='append', choices=ENGINES,
+                        help='engine to benchmark, repeatable '
+                        '(default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timing runs per stage, best is kept')
+    parser.add_argument('--data', default=DATA_DIR,
+                        help='folder of xml feeds')
+    parser.add_argument('--output', help='write results to this file')
+    parser.add_argument('--compare', help='results file to compare with')
+    args = parser.parse_args(argv)
+
+    results = run(args.engine or ENGINES, args.repeat, args.data)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(json.load(f), results)),
+                  file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+'''Rebuild weathergc/cities.tsv, the packaged city catalogue.
+
+Codes, names and provinces come from the feeds in the data folder (see
+refresh_data.py).  The feeds carry no coordinates; they are added from the
+Datamart site list and, for the cities it does not match, from a GeoNames
+dump, both matched by name and province:
+
+    python -m weathergc.tests.build_cities
+    python -m weathergc.tests.build_cities --sites site_list_en.csv \
+        --geonames CA.txt
+
+site_list_en.csv is published at
+https://dd.weather.gc.ca/citypage_weather/docs/site_list_en.csv and CA.txt
+(CC BY 4.0) at https://download.geonames.org/export/dump/CA.zip
+'''
+from __future__ import absolute_import, print_function
+import argparse
+import csv
+import io
+import os
+import re
+
+from weathergc.atom import parse_feed
+from weathergc.cities import CATALOGUE_PATH, fold
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+TITLE_SUFFIX = ' - Weather - Environment Canada'
+
+
+def _code_key(code):
+    prefix, suffix = code.split('-')
+    letters, number = re.match(r'([a-z]?)(\d+)$', suffix).groups()
+    return prefix, letters, int(number)
+
+
+def read_feeds(folder):
+    '''Return {code: (province, name)} for every feed in folder.'''
+    cities = {}
+    for filename in os.listdir(folder):
+        if not filename.endswith('.xml'):
+            continue
+        code = filename[:-4]
+        with open(os.path.join(folder, filename), 'rb') as f:
+            title = parse_feed(f.read())['meta']['title']
+        if title.endswith(TITLE_SUFFIX):
+            title = title[:-len(TITLE_SUFFIX)]
+        cities[code] = (code.split('-')[0].upper(), title)
+    return cities
+
+
+def _degrees(value):
+    '''Convert Datamart coordinates such as 43.47N or 80.52W.'''
+    number, hemisphere = float(value[:-1]), value[-1].upper()
+    return -number if hemisphere in 'SW' else number
+
+
+def read_sites(path):
+    '''Return {(province, folded name): (lat, lon)} from the site list.'''
+    sites = {}
+    with io.open(path, encoding='utf-8-sig') as f:
+        lines = f.read().splitlines()
+    # the first line is a title, the second the column names
+    for row in csv.DictReader(lines[1:]):
+        try:
+            position = (_degrees(row['Latitude']),
+                        _degrees(row['Longitude']))
+        except (KeyError, ValueError, IndexError):
+            continue
+        sites[(row['Province Codes'], fold(row['English Names']))] = position
+    return sites
+
+
+# GeoNames admin1 codes of the provinces and territories
+GEONAMES_PROVINCES = {'01': 'AB', '02': 'BC', '03': 'MB', '04': 'NB',
+                      '05': 'NL', '07': 'NS', '08': 'ON', '09': 'PE',
+                      '10': 'QC', '11': 'SK', '12': 'YT', '13': 'NT',
+                      '14': 'NU'}
+
+
+def read_geonames(path):
+    '''Return {(province, folded name): (lat, lon)} from a GeoNames dump.
+
+    Every name and alternate name of a Canadian place is a key; where two
+    places share one, the more populous wins.
+    '''
+    sites, populations = {}, {}
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            row = line.rstrip('\n').split('\t')
+            if len(row) < 15 or row[8] != 'CA' or row[6] != 'P':
+                continue
+            province = GEONAMES_PROVINCES.get(row[10])
+            if province is None:
+                continue
+            position = (float(row[4]), float(row[5]))
+            population = int(row[14] or 0)
+            names = [row[1], row[2]] + row[3].split(',')
+            for key in set((province, fold(name)) for name in names if name):
+                if population >= populations.get(key, -1):
+                    sites[key], populations[key] = position, population
+    return sites
+
+
+def _locate(sites, province, name):
+    '''Position of a city in sites, also trying its name without a
+    qualifier, e.g. Victoria for "Victoria (Hartland)", and the first of
+    two joined names, e.g. Kitchener for "Kitchener-Waterloo".'''
+    candidates = [name, name.split('(')[0].strip(), name.split('-')[0]]
+    for candidate in candidates:
+        position = sites.get((province, fold(candidate)))
+        if position is not None:
+            return position
+    return None
+
+
+def write_catalogue(cities, sources, path):
+    '''Write the catalogue, taking each position from the first source
+    that matches the city.
+
+    Returns:
+        number of cities written with coordinates
+    '''
+    matched = 0
+    with io.open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for code in sorted(cities, key=_code_key):
+            province, name = cities[code]
+            position = None
+            for sites in sources:
+                position = _locate(sites, province, name)
+                if position is not None:
+                    break
+            if position is not None:
+                matched += 1
+                lat, lon = '%.2f' % position[0], '%.2f' % position[1]
+            else:
+                lat = lon = ''
+            f.write(u'\t'.join((code, province, name, lat, lon)) + u'\n')
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--data', default=DATA_DIR,
+                        help='folder of city feeds')
+    parser.add_argument('--sites', help='Datamart site_list_en.csv')
+    parser.add_argument('--geonames', help='GeoNames dump, e.g. CA.txt')
+    parser.add_argument('--output', default=CATALOGUE_PATH)
+    args = parser.parse_args()
+
+    cities = read_feeds(args.data)
+    sources = []
+    if args.sites:
+        sources.append(read_sites(args.sites))
+    if args.geonames:
+        sources.append(read_geonames(args.geonames))
+    matched = write_catalogue(cities, sources, args.output)
+    print('%d cities written to %s, %d with coordinates'
+          % (len(cities), args.output, matched))
+
+
+if __name__ == '__main__':
+    main()
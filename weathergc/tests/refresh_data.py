@@ -4,8 +4,8 @@ from urllib import request
 city_base = 'https://weather.gc.ca/rss/city/prov-city_e.xml'
 prov_base = 'https://weather.gc.ca/forecast/canada/index_e.html?id='
 
-provinces = ['ON', 'BC', 'MB', 'NB', 'NL', 'NS', 'NT', 'NU', 'PE', 'QC', 'SK',
-             'YT']
+provinces = ['AB', 'ON', 'BC', 'MB', 'NB', 'NL', 'NS', 'NT', 'NU', 'PE', 'QC',
+             'SK', 'YT']
 
 urls_pattern = re.compile(
     r'<li><a href="/city/pages/(.*)_metric_e.html">.*</a></li>', re.MULTILINE)
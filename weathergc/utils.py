@@ -10,6 +10,42 @@ def html_to_dict(html):
     return dict([(x[0].strip(), x[1].strip()) for x in pattern.findall(html)])
 
 
+def feed_updated(xml):
+    '''Return the feed level <updated> timestamp of a raw atom document
+    without parsing it, or None when it cannot be found.
+
+    The feed stamp precedes the first <entry>, so only that prefix is
+    searched.
+    '''
+    if isinstance(xml, bytes):
+        match = _FEED_UPDATED_BYTES.search(xml, 0, _head_end(xml, b'<entry'))
+        return match.group(1).decode('ascii') if match else None
+    match = _FEED_UPDATED.search(xml, 0, _head_end(xml, '<entry'))
+    return match.group(1) if match else None
+
+
+def _head_end(xml, marker):
+    end = xml.find(marker)
+    return len(xml) if end == -1 else end
+
+
+_FEED_UPDATED = re.compile(r'<updated>\s*([^<\s]*)\s*</updated>')
+_FEED_UPDATED_BYTES = re.compile(br'<updated>\s*([^<\s]*)\s*</updated>')
+
+
+def copy_tree(obj):
+    '''Copy a tree of dicts and lists whose leaves are immutable.
+
+    Much cheaper than copy.deepcopy for parsed feed data, which only holds
+    strings at the leaves.
+    '''
+    if isinstance(obj, dict):
+        return dict((key, copy_tree(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return [copy_tree(value) for value in obj]
+    return obj
+
+
 def list_iter(obj):
     '''Ensure obj is either a list, or is converted to one.'''
     if obj:
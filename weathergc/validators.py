@@ -1,58 +1,81 @@
 # -*- coding: utf-8 -*-
 '''Schema definitions
+
+voluptuous is imported and the schemas are built on first access to any of
+SCHEMAS, so importing weathergc does not pay for them up front.
 '''
-import sys
+from weathergc.utils import html_to_dict
 
-from voluptuous import (ALLOW_EXTRA, REMOVE_EXTRA, All, Any, Remove, Replace,
-                        Schema, SetTo)
-from voluptuous.util import Strip
+SCHEMAS = ('META_SCHEMA', 'ENTRY_SCHEMA', 'WW_SCHEMA', 'CC_SCHEMA',
+           'WF_SCHEMA')
+
+
+def _build():
+    '''Construct the schemas and return them by name.'''
+    from voluptuous import (ALLOW_EXTRA, REMOVE_EXTRA, All, Any, Remove,
+                            Replace, Schema, SetTo)
+    from voluptuous.util import Strip
+
+    # top level validator, ensure we're dealing with a known file format
+    META_SCHEMA = Schema(
+        {All('@xml:lang', SetTo('lang')): 'en-ca',
+         Remove('@xmlns'): 'http://www.w3.org/2005/Atom',
+         'author': {'name': 'Environment Canada',
+                    'uri': 'http://www.weather.gc.ca'},
+         'logo': str,
+         'rights': str,
+         'title': str,
+         'updated': str,
+         Remove('entry'): Any(list, dict)},
+        extra=REMOVE_EXTRA)
+
+    # Validator for each member of the 'entry' list in the feed.
+    # Includes some minor transformations to simplify later validations.
+    # The atom id is kept to tell entries apart between refreshes, see
+    # weathergc.diff, and removed by the section schemas below.
+    ENTRY_SCHEMA = Schema(
+        {'category': All({'@term': Any('Weather Forecasts',
+                                       'Current Conditions',
+                                       'Warnings and Watches')},
+                         dict.values, ''.join),
+         'id': str,
+         Remove('link'):
+         {'@href': str,
+          '@type': 'text/html'},
+         'published': str,
+         'summary': All({'#text': str,
+                         Remove('@type'): 'html'}, dict.values, ''.join),
+         'title': str,
+         'updated': str},
+        extra=REMOVE_EXTRA)
+
+    WW_SCHEMA = Schema({Remove('category'): str,
+                        Remove('id'): str}, extra=ALLOW_EXTRA)
+
+    CC_SCHEMA = Schema(
+        {Remove('category'): str,
+         Remove('id'): str,
+         All('summary', SetTo('data')):
+         All(Replace('&deg;', ' '), Replace(u'\N{DEGREE SIGN}', ' '),
+             html_to_dict),
+         'title': All(Replace('&deg;', ' '),
+                      Replace(u'\N{DEGREE SIGN}', ' '))},
+        extra=ALLOW_EXTRA)
+
+    WF_SCHEMA = Schema({Remove('category'): str,
+                        Remove('id'): str,
+                        'summary': All(Replace('Forecast issued.*$', ''),
+                                       Strip),
+                        }, extra=ALLOW_EXTRA)
+
+    return dict((name, value) for name, value in locals().items()
+                if name in SCHEMAS)
 
-from weathergc.utils import html_to_dict
 
-is_python3 = sys.version_info.major == 3
-if is_python3:
-    unicode = str
-
-# top level validator, ensure we're dealing with a known file format
-META_SCHEMA = Schema(
-    {All('@xml:lang', SetTo('lang')): 'en-ca',
-     Remove('@xmlns'): 'http://www.w3.org/2005/Atom',
-     'author': {'name': 'Environment Canada',
-                'uri': 'http://www.weather.gc.ca'},
-     'logo': unicode,
-     'rights': unicode,
-     'title': unicode,
-     'updated': unicode,
-     Remove('entry'): Any(list, dict)},
-    extra=REMOVE_EXTRA)
-
-# Validator for each member of the 'entry' list in the feed.
-# Includes some minor transformations to simplify later validations
-ENTRY_SCHEMA = Schema(
-    {'category': All({'@term': Any('Weather Forecasts', 'Current Conditions',
-                                   'Warnings and Watches')}, dict.values,
-                     ''.join),
-     Remove('id'): unicode,
-     Remove('link'):
-     {'@href': unicode,
-      '@type': 'text/html'},
-     'published': unicode,
-     'summary': All({'#text': unicode,
-                     Remove('@type'): 'html'}, dict.values, ''.join),
-     'title': unicode,
-     'updated': unicode},
-    extra=REMOVE_EXTRA)
-
-WW_SCHEMA = Schema({Remove('category'): unicode}, extra=ALLOW_EXTRA)
-
-CC_SCHEMA = Schema(
-    {Remove('category'): unicode,
-     All('summary', SetTo('data')):
-     All(Replace('&deg;', ' '), Replace(u'\N{DEGREE SIGN}', ' '),
-         html_to_dict),
-     'title': All(Replace('&deg;', ' '), Replace(u'\N{DEGREE SIGN}', ' '))},
-    extra=ALLOW_EXTRA)
-
-WF_SCHEMA = Schema({Remove('category'): unicode,
-                    'summary': All(Replace('Forecast issued.*$', ''), Strip),
-}, extra=ALLOW_EXTRA)
+def __getattr__(name):
+    '''Build the schemas when one is first used (PEP 562).'''
+    if name not in SCHEMAS:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    globals().update(_build())
+    return globals()[name]